@@ -0,0 +1,71 @@
+"""The two networks trained in the notebook, as functions the training script can build."""
+from tensorflow.keras import layers, models
+from tensorflow.keras.optimizers import Adam
+
+
+def sequential_model(input_shape, num_classes):
+    """The notebook's first model (shipped as skin_model.keras)."""
+    return models.Sequential([
+        layers.Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        layers.Flatten(),
+        layers.Dense(128, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(0.5),
+
+        layers.Dense(num_classes, activation='softmax'),
+    ])
+
+
+def hybrid_nn_model(input_shape, num_classes):
+    """The notebook's CNN + LSTM model (shipped as skin_cancerr.h5)."""
+    inputs = layers.Input(shape=input_shape)
+
+    x = layers.Conv2D(32, (3, 3), activation='relu', padding='same')(inputs)
+    x = layers.BatchNormalization()(x)
+    x = layers.MaxPooling2D((2, 2))(x)
+
+    x = layers.Conv2D(64, (3, 3), activation='relu', padding='same')(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.MaxPooling2D((2, 2))(x)
+
+    x = layers.Conv2D(128, (3, 3), activation='relu', padding='same')(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.MaxPooling2D((2, 2))(x)
+
+    x = layers.GlobalAveragePooling2D()(x)
+    # The pooled features go through the LSTM as a one-step sequence
+    x = layers.Reshape((-1, 128))(x)
+    x = layers.LSTM(64, return_sequences=False)(x)
+
+    x = layers.Dense(512, activation='relu')(x)
+    x = layers.Dropout(0.5)(x)
+    x = layers.Dense(256, activation='relu')(x)
+    x = layers.Dropout(0.5)(x)
+
+    outputs = layers.Dense(num_classes, activation='softmax')(x)
+    return models.Model(inputs, outputs)
+
+
+# Builder and learning rate used for each architecture in the notebook
+ARCHITECTURES = {
+    "hybridcnn": (hybrid_nn_model, 1e-3),
+    "sequential": (sequential_model, 1e-4),
+}
+
+
+def build_model(name, input_shape, num_classes):
+    """Build and compile an architecture the way the notebook does."""
+    builder, learning_rate = ARCHITECTURES[name]
+    model = builder(input_shape, num_classes)
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model
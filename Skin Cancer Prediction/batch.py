@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import TARGET_SIZE, CHANNELS, to_rgb, preprocess_batch
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp'}
+
+# Skip archive members that would decompress to something absurd for a lesion photo
+MAX_MEMBER_BYTES = 50 * 1024 * 1024
+
+
+def is_image_name(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_zip_images(stream):
+    """Yield (name, open_fn) for each image in a ZIP archive without extracting the whole archive.
+
+    Each member is read while the archive is still open, since the last chunk of
+    a batch is only decoded after this generator has finished and closed it.
+    """
+    with zipfile.ZipFile(stream) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image_name(info.filename) or info.filename.startswith('__MACOSX/'):
+                continue
+            if info.file_size > MAX_MEMBER_BYTES:
+                yield info.filename, None
+                continue
+            data = archive.read(info)
+            yield info.filename, (lambda data=data: io.BytesIO(data))
+
+
+def _unreadable(message):
+    def open_fn():
+        raise ValueError(message)
+    return open_fn
+
+
+def iter_uploaded_images(uploads):
+    """Yield (name, open_fn) for (filename, UploadBuffer) pairs, expanding any ZIP archives among them.
+
+    The buffers are taken off the request before a streamed response starts,
+    since the request closes its files first. Each file is read here, while its
+    buffer still exists, and every buffer is discarded once this generator ends.
+    """
+    try:
+        for filename, upload in uploads:
+            if filename.lower().endswith('.zip'):
+                with upload.open() as stream:
+                    if zipfile.is_zipfile(stream):
+                        yield from iter_zip_images(stream)
+                    else:
+                        yield filename, _unreadable("Not a valid ZIP archive")
+            elif upload.size > MAX_MEMBER_BYTES:
+                yield filename, None
+            else:
+                with upload.open() as stream:
+                    data = stream.read()
+                yield filename, (lambda data=data: io.BytesIO(data))
+            upload.discard()
+    finally:
+        for _, upload in uploads:
+            upload.discard()
+
+
+def decode_image(fp):
+    """Decode one image (a path or binary stream) to uint8 model-input pixels; shared by the web, CLI and ingest paths."""
+    with Image.open(fp) as img:
+        return np.asarray(to_rgb(img), dtype=np.uint8)
+
+
+def _decode(item):
+    name, open_fn = item
+    if open_fn is None:
+        return name, None, "File too large"
+    try:
+        return name, decode_image(open_fn()), None
+    except (ValueError, OSError) as e:
+        return name, None, f"Could not read image: {e}"
+
+
+def chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def score_images(items, predict_fn, labels, batch_size=32, decode_workers=4):
+    """Decode images on a thread pool and predict them in fixed-size batches, yielding one result per image.
+
+    Only one batch of images is held in memory at a time, whatever the number of inputs.
+    """
+    buffer = np.empty((batch_size, TARGET_SIZE[1], TARGET_SIZE[0], CHANNELS), dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        for chunk in chunks(items, batch_size):
+            decoded = list(pool.map(_decode, chunk))
+            ok = [i for i, (_, _, error) in enumerate(decoded) if error is None]
+            predictions = {}
+            if ok:
+                batch = preprocess_batch([decoded[i][1] for i in ok], out=buffer)
+                predictions = dict(zip(ok, np.asarray(predict_fn(batch))))
+
+            # Keep results in input order, errors included
+            for i, (name, _, error) in enumerate(decoded):
+                if error is not None:
+                    yield {"filename": name, "error": error}
+                    continue
+                row = predictions[i]
+                label = int(np.argmax(row))
+                yield {
+                    "filename": name,
+                    "label": label,
+                    "class_name": labels.get(label),
+                    "probabilities": {labels.get(c, str(c)): float(p) for c, p in enumerate(row)},
+                }
+
+
+def to_ndjson(results):
+    for result in results:
+        yield json.dumps(result) + "\n"
+
+
+def to_csv(results, labels):
+    class_names = [labels[i] for i in sorted(labels)]
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def flush():
+        data = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return data
+
+    writer.writerow(["filename", "class_name", "error"] + class_names)
+    yield flush()
+    for result in results:
+        probabilities = result.get("probabilities", {})
+        writer.writerow([result["filename"], result.get("class_name", ""), result.get("error", "")]
+                        + [probabilities.get(name, "") for name in class_names])
+        yield flush()
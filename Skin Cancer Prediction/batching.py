@@ -0,0 +1,71 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Group concurrent prediction requests into one forward pass of the model."""
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0):
+        # predict_fn takes an (N, 28, 28, 3) array and returns an (N, num_classes) array
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # Start the worker on first use so the batcher survives a fork of the parent process
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def submit(self, img_array):
+        """Queue a (1, 28, 28, 3) array and return a Future for its (1, num_classes) prediction."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((img_array, future))
+        return future
+
+    def predict(self, img_array, timeout=None):
+        """Blocking drop-in replacement for model.predict() on a single image."""
+        return self.submit(img_array).result(timeout=timeout)
+
+    def _collect(self):
+        # Block for the first request, then wait at most max_wait for more to arrive
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            arrays = [array for array, _ in items]
+            futures = [future for _, future in items]
+            try:
+                batch = np.concatenate(arrays, axis=0)
+                predictions = np.asarray(self.predict_fn(batch))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            # Hand each caller back its own rows of the batch output
+            offset = 0
+            for array, future in zip(arrays, futures):
+                count = array.shape[0]
+                future.set_result(predictions[offset:offset + count])
+                offset += count
@@ -0,0 +1,71 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+from keras.models import load_model
+
+from batching import MicroBatcher
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q)) * 1000.0
+
+
+def run_load(predict_one, clients, requests_per_client):
+    """Fire requests from concurrent clients and return (latencies, wall time)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        img_array = np.random.rand(1, 28, 28, 3).astype(np.float32)
+        local = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            predict_one(img_array)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - start
+
+
+def report(name, latencies, wall):
+    print(f"{name:>12}: p50 {percentile_ms(latencies, 50):8.2f} ms  "
+          f"p99 {percentile_ms(latencies, 99):8.2f} ms  "
+          f"throughput {len(latencies) / wall:8.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request predict() with micro-batched inference.")
+    parser.add_argument("--model", default="./skin_cancerr.h5")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per client")
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    # Warm up so graph building is not counted against either path
+    model.predict(np.zeros((1, 28, 28, 3), dtype=np.float32), verbose=0)
+
+    def per_request(img_array):
+        return model.predict(img_array, verbose=0)
+
+    batcher = MicroBatcher(lambda batch: model.predict(batch, verbose=0),
+                           max_batch_size=args.max_batch_size,
+                           max_wait_ms=args.max_wait_ms)
+
+    print(f"{args.clients} clients x {args.requests} requests on {args.model}")
+    report("per-request", *run_load(per_request, args.clients, args.requests))
+    report("micro-batch", *run_load(batcher.predict, args.clients, args.requests))
+
+
+if __name__ == '__main__':
+    main()
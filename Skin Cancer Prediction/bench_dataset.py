@@ -0,0 +1,60 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import csv_to_dataset, open_dataset
+from preprocessing import pixels_to_batch
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare loading a pixel CSV with opening the memory-mapped store.")
+    parser.add_argument("csv", help="Pixel CSV, e.g. merged_RGB.csv")
+    parser.add_argument("--store", default=None, help="Store to compare against; built from the CSV if missing")
+    parser.add_argument("--batch-size", type=int, default=512)
+    args = parser.parse_args()
+
+    store = args.store or os.path.splitext(args.csv)[0] + ".dataset"
+    if not os.path.exists(store):
+        _, seconds = timed(lambda: csv_to_dataset([args.csv], store))
+        print(f"Built {store} in {seconds:.2f}s (one-off)")
+
+    def load_csv():
+        frame = pd.read_csv(args.csv)
+        labels = frame.pop('label').to_numpy()
+        return pixels_to_batch(frame.to_numpy(dtype=np.uint8)), labels
+
+    def open_store():
+        data = open_dataset(store)
+        return data.images, data.labels
+
+    def read_store():
+        # Touch every page, as one training epoch would
+        data = open_dataset(store)
+        return sum(int(batch.shape[0]) for batch, _ in data.iter_batches(args.batch_size))
+
+    (csv_images, _), csv_seconds = timed(load_csv)
+    _, open_seconds = timed(open_store)
+    count, read_seconds = timed(read_store)
+
+    print(f"{count} images")
+    print(f"  CSV      {os.path.getsize(args.csv) / 1e6:8.1f} MB  read_csv + to float32: {csv_seconds:8.3f}s  "
+          f"({csv_images.nbytes / 1e6:.0f} MB resident)")
+    print(f"  store    {directory_size(store) / 1e6:8.1f} MB  open (memory-mapped):   {open_seconds:8.3f}s")
+    print(f"  {'':>20}  full pass in batches of {args.batch_size}: {read_seconds:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from database import Database
+
+CREATE_BOOKINGS = '''CREATE TABLE IF NOT EXISTS bookings (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT NOT NULL,
+                        email TEXT NOT NULL,
+                        phone TEXT,
+                        date TEXT NOT NULL,
+                        message TEXT
+                    )'''
+INSERT_BOOKING = '''INSERT INTO bookings (name, email, phone, date, message)
+                    VALUES (?, ?, ?, ?, ?)'''
+
+
+def booking(writer, i):
+    return (f"Patient {writer}-{i}", f"patient{writer}@example.com", "5550100", f"2026-11-{i % 28 + 1:02d}", "Checkup")
+
+
+def connect_per_call(path, writer, count, errors):
+    """The old pattern: open, write, commit and close a connection for every booking."""
+    for i in range(count):
+        try:
+            conn = sqlite3.connect(path)
+            conn.execute(INSERT_BOOKING, booking(writer, i))
+            conn.commit()
+            conn.close()
+        except sqlite3.OperationalError:
+            errors.append(1)
+
+
+def pooled(database, writer, count, errors):
+    for i in range(count):
+        try:
+            with database.transaction() as conn:
+                conn.execute(INSERT_BOOKING, booking(writer, i))
+        except sqlite3.OperationalError:
+            errors.append(1)
+
+
+def run(name, target, make_args, writers, count):
+    errors = []
+    threads = [threading.Thread(target=target, args=make_args(w) + (count, errors)) for w in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    written = writers * count - len(errors)
+    print(f"{name:>16}: {written / wall:9.1f} bookings/s  ({written} written, {len(errors)} 'database is locked' errors)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking writes per second under concurrent writers.")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--bookings", type=int, default=500, help="Bookings per writer")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+
+    old_path = os.path.join(workdir, "per-call.db")
+    conn = sqlite3.connect(old_path)
+    conn.execute(CREATE_BOOKINGS)
+    conn.close()
+    run("connect-per-call", connect_per_call, lambda w: (old_path, w), args.writers, args.bookings)
+
+    database = Database(os.path.join(workdir, "pooled.db"))
+    database.execute(CREATE_BOOKINGS)
+    run("pooled + WAL", pooled, lambda w: (database, w), args.writers, args.bookings)
+
+
+if __name__ == '__main__':
+    main()
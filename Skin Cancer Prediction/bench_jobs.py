@@ -0,0 +1,89 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from keras.models import load_model
+
+from inference import create_engine
+from jobs import JobQueue
+
+
+def cpu_seconds():
+    # Includes worker processes once they have exited (POSIX only)
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def report(name, count, wall, cpu):
+    utilization = cpu / (wall * os.cpu_count())
+    print(f"{name:>6}: {count / wall:8.1f} images/s  wall {wall:6.2f}s  "
+          f"cpu {cpu:6.2f}s  utilization {utilization * 100:5.1f}% of {os.cpu_count()} cores")
+
+
+def run_sync(model_path, backend, clients, images):
+    """Threads predicting in the web process, like synchronous Flask workers."""
+    engine = create_engine(load_model(model_path), backend)
+    engine.predict(np.zeros((1, 28, 28, 3), dtype=np.float32))
+    per_client = images // clients
+
+    def client():
+        img_array = np.random.rand(1, 28, 28, 3).astype(np.float32)
+        for _ in range(per_client):
+            engine.predict(img_array)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    cpu_start, start = cpu_seconds(), time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return per_client * clients, time.perf_counter() - start, cpu_seconds() - cpu_start
+
+
+def run_async(model_path, workers, images):
+    """Submit every image to the job queue and wait for all of them.
+
+    Worker CPU time is only visible once the processes exit, so the async
+    figure also includes each worker loading the model.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    queue = JobQueue(db_path, workers=workers)
+    labels = {}
+    # Warm up every worker process so model loading isn't timed
+    warmup = [queue.submit("bench", model_path, labels, np.zeros((1, 28, 28, 3), dtype=np.float32))
+              for _ in range(workers * 2)]
+    while any(queue.get(job_id)["status"] not in ("done", "failed") for job_id in warmup):
+        time.sleep(0.1)
+
+    cpu_start, start = cpu_seconds(), time.perf_counter()
+    job_ids = [queue.submit("bench", model_path, labels, np.random.rand(1, 28, 28, 3).astype(np.float32))
+               for _ in range(images)]
+    pending = set(job_ids)
+    while pending:
+        pending = {job_id for job_id in pending if queue.get(job_id)["status"] not in ("done", "failed")}
+        time.sleep(0.05)
+    wall = time.perf_counter() - start
+    queue.shutdown()
+    return images, wall, cpu_seconds() - cpu_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare synchronous and job-queue inference under load.")
+    parser.add_argument("--model", default="./skin_cancerr.h5")
+    parser.add_argument("--backend", default="function")
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent synchronous request threads")
+    parser.add_argument("--workers", type=int, default=2, help="Job queue worker processes")
+    args = parser.parse_args()
+
+    # Worker processes use the same backend as the synchronous path
+    os.environ["INFERENCE_BACKEND"] = args.backend
+    report("sync", *run_sync(args.model, args.backend, args.clients, args.images))
+    report("async", *run_async(args.model, args.workers, args.images))
+
+
+if __name__ == '__main__':
+    main()
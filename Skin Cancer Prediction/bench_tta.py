@@ -0,0 +1,71 @@
+import argparse
+import time
+
+import numpy as np
+from keras.models import load_model
+
+from bundles import held_out_seed, resolve_model
+from calibration import validation_split
+from inference import BACKENDS, create_engine
+from models import SHIPPED_MODELS
+from preprocessing import pixels_to_batch
+from tta import MAX_VIEWS, predict_tta
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q)) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy and latency of test-time augmentation for K views per image.")
+    parser.add_argument("source", help="Image store or pixel CSV with a 'label' column, e.g. merged_RGB.dataset")
+    parser.add_argument("--model", default=SHIPPED_MODELS[0]["name"], help="Shipped model name or bundle directory")
+    parser.add_argument("--backend", default="function", choices=sorted(BACKENDS))
+    parser.add_argument("--views", default="1,2,4,8", help=f"Comma-separated K values, each from 1 to {MAX_VIEWS}")
+    parser.add_argument("--requests", type=int, default=200, help="Single-image requests timed per K")
+    parser.add_argument("--seed", type=int, default=42, help="Split seed, unless the model is a bundle trained on source")
+    args = parser.parse_args()
+
+    model = resolve_model(args.model)
+    seed = held_out_seed(model["bundle"], args.source)
+    if seed is None:
+        seed = args.seed
+        print(f"Warning: {args.model} was not trained by train.py on {args.source}, so the validation images may "
+              f"have been training images and the accuracies below are inflated; the relative TTA effect and "
+              f"latencies still hold")
+    # The same split calibration.py fits on
+    X_val, y_val = validation_split(args.source, model["labels"], seed)
+    X_val = pixels_to_batch(X_val)
+
+    engine = create_engine(load_model(model["path"]), args.backend)
+    views = [int(k) for k in args.views.split(",")]
+    print(f"{model['name']} ({args.backend}), {len(y_val)} validation images")
+
+    baseline = None
+    for k in views:
+        # Warm up so tracing for the new batch shape is not timed
+        predict_tta(engine.predict, X_val[:1], k)
+
+        # Serving path: one image per request, its k views in one forward pass
+        latencies = []
+        for i in range(min(args.requests, len(X_val))):
+            start = time.perf_counter()
+            predict_tta(engine.predict, X_val[i:i + 1], k)
+            latencies.append(time.perf_counter() - start)
+
+        # Accuracy over the whole split, predicted in chunks
+        start = time.perf_counter()
+        predictions = np.concatenate([predict_tta(engine.predict, X_val[i:i + 256], k)
+                                      for i in range(0, len(X_val), 256)])
+        throughput = len(X_val) / (time.perf_counter() - start)
+        accuracy = float(np.mean(predictions.argmax(axis=1) == y_val))
+        if baseline is None:
+            baseline = accuracy
+
+        print(f"K={k}: accuracy {accuracy:.4f} ({accuracy - baseline:+.4f})  "
+              f"p50 {percentile_ms(latencies, 50):7.2f} ms  p99 {percentile_ms(latencies, 99):7.2f} ms  "
+              f"{throughput:8.1f} images/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import base64
+import csv
+import io
+import json
+import threading
+
+# Columns the admin view can sort by; each has a (column, id) index so keyset pages are index range scans
+SORT_COLUMNS = ("date", "email", "name")
+EXPORT_COLUMNS = ("id", "name", "email", "phone", "date", "message")
+MAX_PAGE_SIZE = 500
+
+
+def create_indexes(conn):
+    for column in SORT_COLUMNS:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_bookings_{column}_id ON bookings ({column}, id)")
+    # Superseded by idx_bookings_date_id
+    conn.execute("DROP INDEX IF EXISTS idx_bookings_date")
+
+
+def encode_cursor(value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (sort value, id) from a page cursor, raising ValueError if it is malformed."""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid page cursor") from e
+
+
+def page_size(value, default=50):
+    """Parse a requested page size, falling back to default if it isn't an integer and clamping it to 1..MAX_PAGE_SIZE."""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _where(filters):
+    """Build the WHERE clause for the admin filters: email/name prefixes and a date range."""
+    clauses = []
+    params = []
+    for column in ("email", "name"):
+        if filters.get(column):
+            # A range rather than LIKE, so the prefix match can use the (column, id) index
+            clauses.append(f"{column} >= ? AND {column} < ?")
+            params += [filters[column], filters[column] + "\U0010ffff"]
+    if filters.get("start_date"):
+        clauses.append("date >= ?")
+        params.append(filters["start_date"])
+    if filters.get("end_date"):
+        clauses.append("date <= ?")
+        params.append(filters["end_date"])
+    return clauses, params
+
+
+def page_bookings(database, filters, sort="date", descending=False, after=None, limit=50):
+    """Return (rows, next cursor) for one page of bookings, using keyset pagination on (sort column, id)."""
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by '{sort}'")
+    limit = page_size(limit)
+    clauses, params = _where(filters)
+    if after:
+        value, row_id = decode_cursor(after)
+        clauses.append(f"({sort}, id) {'<' if descending else '>'} (?, ?)")
+        params += [value, row_id]
+    order = "DESC" if descending else "ASC"
+    query = (f"SELECT {', '.join(EXPORT_COLUMNS)} FROM bookings"
+             + (" WHERE " + " AND ".join(clauses) if clauses else "")
+             + f" ORDER BY {sort} {order}, id {order} LIMIT ?")
+    rows = database.fetchall(query, params + [limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[EXPORT_COLUMNS.index(sort)], last[0])
+    return rows, next_cursor
+
+
+def iter_bookings_csv(database, filters, sort="date", descending=False, chunk_size=500):
+    """Yield the filtered bookings as CSV text, one page at a time, without holding the full result."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    after = None
+    while True:
+        rows, after = page_bookings(database, filters, sort, descending, after, chunk_size)
+        writer.writerows(rows)
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+        if after is None:
+            return
+
+
+class DistinctEmailCache:
+    """Cache of the distinct booking emails, refreshed whenever a new booking has been inserted.
+
+    Freshness is checked against MAX(id), a single index lookup, so inserts made
+    by other processes invalidate the cache too.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._emails = None
+        self._max_id = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._emails = None
+
+    def get(self):
+        max_id = self.database.fetchone("SELECT MAX(id) FROM bookings")[0]
+        with self._lock:
+            if self._emails is not None and self._max_id == max_id:
+                return self._emails
+        emails = [row[0] for row in self.database.fetchall("SELECT DISTINCT email FROM bookings ORDER BY email")]
+        with self._lock:
+            self._emails = emails
+            self._max_id = max_id
+        return emails
@@ -0,0 +1,137 @@
+"""Versioned model artifact bundles written by train.py.
+
+Each training run creates <root>/<name>/<version>/ holding model.keras and
+bundle.json. bundle.json records the label map, the preprocessing the model
+expects, the data and hyperparameters it was trained with, and its
+validation metrics. The web app registers the latest version of every bundle:
+
+    artifacts/hybridcnn/1/model.keras
+    artifacts/hybridcnn/1/bundle.json
+
+Bundles are served as version "bundle-<n>" (e.g. ?model=hybridcnn:bundle-1), so
+they never share a version, and with it prediction cache entries, with the
+shipped model of the same name.
+"""
+import json
+import os
+import platform
+from datetime import datetime, timezone
+
+from models import SHIPPED_MODELS, register_variants
+from preprocessing import PREPROCESSING_SPEC
+
+BUNDLE_FILE = "bundle.json"
+MODEL_FILE = "model.keras"
+
+
+def _versions(root, name):
+    directory = os.path.join(root, name)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(v) for v in os.listdir(directory)
+                  if v.isdigit() and os.path.exists(os.path.join(directory, v, BUNDLE_FILE)))
+
+
+def serving_version(bundle):
+    """The version a bundle is registered and cached under; distinct from every shipped model's version."""
+    return f"bundle-{bundle['version']}"
+
+
+def next_version(root, name):
+    versions = _versions(root, name)
+    return versions[-1] + 1 if versions else 1
+
+
+def write_bundle(root, name, model, labels, training, data, metrics, version=None):
+    """Save a trained model with its metadata as a new bundle version; returns the bundle directory."""
+    import tensorflow as tf
+
+    version = version or next_version(root, name)
+    directory = os.path.join(root, name, str(version))
+    if os.path.exists(os.path.join(directory, BUNDLE_FILE)):
+        raise FileExistsError(f"Bundle {name} version {version} already exists")
+    os.makedirs(directory, exist_ok=True)
+    model.save(os.path.join(directory, MODEL_FILE))
+    bundle = {
+        "name": name,
+        "version": str(version),
+        "model_file": MODEL_FILE,
+        "labels": {str(label): class_name for label, class_name in labels.items()},
+        "preprocessing": PREPROCESSING_SPEC,
+        "training": training,
+        "data": data,
+        "metrics": metrics,
+        "environment": {"python": platform.python_version(), "tensorflow": tf.__version__},
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    # bundle.json goes last: a directory without it is an unfinished run and is ignored
+    with open(os.path.join(directory, BUNDLE_FILE), "w") as f:
+        json.dump(bundle, f, indent=2)
+    return directory
+
+
+def read_bundle(directory):
+    """Load bundle.json, with integer label keys and the model path resolved."""
+    with open(os.path.join(directory, BUNDLE_FILE)) as f:
+        bundle = json.load(f)
+    bundle["labels"] = {int(label): class_name for label, class_name in bundle["labels"].items()}
+    bundle["model_path"] = os.path.join(directory, bundle["model_file"])
+    return bundle
+
+
+def resolve_model(target):
+    """Describe a shipped model name, bundle directory or model file as {name, path, labels, version, bundle}.
+
+    bundle is the bundle's metadata, or None for shipped models and bare model files.
+    """
+    if os.path.exists(os.path.join(target, BUNDLE_FILE)):
+        bundle = read_bundle(target)
+        return {"name": bundle["name"], "path": bundle["model_path"], "labels": bundle["labels"],
+                "version": serving_version(bundle), "bundle": bundle}
+    for spec in SHIPPED_MODELS:
+        if spec["name"] == target:
+            return dict(spec, bundle=None)
+    if os.path.isfile(target):
+        return {"name": os.path.splitext(os.path.basename(target))[0], "path": target, "labels": None,
+                "version": None, "bundle": None}
+    raise SystemExit(f"'{target}' is not a shipped model, a bundle directory or a model file")
+
+
+def held_out_seed(bundle, source):
+    """The split seed train.py used for a bundle, or None if source isn't the data the bundle was trained on.
+
+    Only a bundle's own split of its own data is guaranteed to keep validation
+    rows out of training. The shipped models were trained in the notebook,
+    which oversampled before splitting, so most rows of any split of
+    merged_RGB were training images for them.
+    """
+    from dataset import fingerprint
+
+    if bundle is None or bundle["data"].get("sha256") != fingerprint(source):
+        return None
+    return bundle["training"]["seed"]
+
+
+def latest_bundles(root):
+    """{name: directory} of the newest version of every bundle under root."""
+    if not os.path.isdir(root):
+        return {}
+    latest = {}
+    for name in sorted(os.listdir(root)):
+        versions = _versions(root, name)
+        if versions:
+            latest[name] = os.path.join(root, name, str(versions[-1]))
+    return latest
+
+
+def register_bundles(registry, root):
+    """Register the newest version of each bundle and its exported variants, replacing shipped models of the same name."""
+    for name, directory in latest_bundles(root).items():
+        bundle = read_bundle(directory)
+        if bundle["preprocessing"] != PREPROCESSING_SPEC:
+            print(f"Skipping bundle {directory}: it expects different preprocessing ({bundle['preprocessing']})")
+            continue
+        version = serving_version(bundle)
+        registry.register(name, bundle["model_path"], labels=bundle["labels"], version=version)
+        register_variants(registry, name, bundle["model_path"], bundle["labels"], version)
+        print(f"Registered model '{name}' version {version} from {directory}")
@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """LRU/TTL cache of model outputs keyed by a hash of the uploaded bytes and the model version."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_path=None, disk_max_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_path:
+            self._create_disk_table()
+
+    @staticmethod
+    def key(digest, model_name, model_version):
+        """Build a cache key from the SHA-256 hex digest of the uploaded bytes and the model version."""
+        return f"{model_name}:{model_version}:{digest}"
+
+    def _create_disk_table(self):
+        conn = sqlite3.connect(self.disk_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS predictions (
+                            key TEXT PRIMARY KEY,
+                            probabilities BLOB NOT NULL,
+                            created REAL NOT NULL
+                        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_created ON predictions (created)")
+        conn.commit()
+        conn.close()
+
+    def _disk_get(self, key):
+        conn = sqlite3.connect(self.disk_path)
+        row = conn.execute("SELECT probabilities, created FROM predictions WHERE key = ?", (key,)).fetchone()
+        conn.close()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).reshape(1, -1), row[1]
+
+    def _disk_put(self, key, prediction, created):
+        conn = sqlite3.connect(self.disk_path)
+        conn.execute("INSERT OR REPLACE INTO predictions (key, probabilities, created) VALUES (?, ?, ?)",
+                     (key, prediction.astype(np.float32).tobytes(), created))
+        # Drop expired rows, then the oldest ones beyond disk_max_entries, so the file can't grow without bound
+        evicted = conn.execute("DELETE FROM predictions WHERE created < ?", (created - self.ttl,)).rowcount
+        evicted += conn.execute("DELETE FROM predictions WHERE key IN "
+                                "(SELECT key FROM predictions ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                                (self.disk_max_entries,)).rowcount
+        conn.commit()
+        conn.close()
+        if evicted:
+            with self._lock:
+                self.stats["disk_evictions"] += evicted
+
+    def get(self, key):
+        """Return the cached (1, num_classes) prediction, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                prediction, created = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return prediction
+                del self._entries[key]
+
+        if self.disk_path:
+            entry = self._disk_get(key)
+            if entry is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._store(key, *entry)
+                return entry[0]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, prediction):
+        created = time.time()
+        prediction = np.asarray(prediction, dtype=np.float32)
+        with self._lock:
+            self._store(key, prediction, created)
+        if self.disk_path:
+            self._disk_put(key, prediction, created)
+
+    def _store(self, key, prediction, created):
+        # Caller holds the lock
+        self._entries[key] = (prediction, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else None
+        return stats
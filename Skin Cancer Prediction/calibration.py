@@ -0,0 +1,132 @@
+"""Temperature scaling for the served models' softmax outputs.
+
+Fit offline on the validation split of a train.py bundle and saved to calibration.json:
+
+    python calibration.py merged_RGB.dataset --model artifacts/hybridcnn/3
+
+Only bundles can be calibrated: their split of the data they were trained on
+is held out. The shipped models saw most rows of any split during training, so
+a temperature fitted on one would make them look better calibrated than they are.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+EPSILON = 1e-7
+
+
+def apply_temperature(probabilities, temperature):
+    """Rescale softmax outputs as softmax(log(p) / T); T > 1 softens overconfident predictions."""
+    logits = np.log(np.clip(np.asarray(probabilities, dtype=np.float64), EPSILON, 1.0)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    scaled = np.exp(logits)
+    return scaled / scaled.sum(axis=-1, keepdims=True)
+
+
+def negative_log_likelihood(probabilities, labels, temperature):
+    scaled = apply_temperature(probabilities, temperature)
+    return float(-np.mean(np.log(np.clip(scaled[np.arange(len(labels)), labels], EPSILON, 1.0))))
+
+
+def expected_calibration_error(probabilities, labels, bins=15):
+    """Average gap between confidence and accuracy over equal-width confidence bins."""
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    error = 0.0
+    for low, high in zip(edges[:-1], edges[1:]):
+        in_bin = (confidence > low) & (confidence <= high)
+        if in_bin.any():
+            error += in_bin.mean() * abs(confidence[in_bin].mean() - correct[in_bin].mean())
+    return float(error)
+
+
+def fit_temperature(probabilities, labels, low=0.05, high=10.0, iterations=60):
+    """Find the temperature minimising validation NLL with a golden-section search over log(T)."""
+    ratio = (np.sqrt(5) - 1) / 2
+    a, b = np.log(low), np.log(high)
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    for _ in range(iterations):
+        if negative_log_likelihood(probabilities, labels, np.exp(c)) < negative_log_likelihood(probabilities, labels, np.exp(d)):
+            b = d
+        else:
+            a = c
+        c, d = b - ratio * (b - a), a + ratio * (b - a)
+    return float(np.exp((a + b) / 2))
+
+
+def load_calibration(path="calibration.json"):
+    """Return the fitted entries from calibration.json, keyed by model name ({} if it hasn't been fitted)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def temperature_for(calibration, model_name, version):
+    """The fitted temperature for a model version; 1.0 (no rescaling) if it was fitted on another version or not at all."""
+    entry = calibration.get(model_name)
+    if entry is None or entry.get("version") != version:
+        return 1.0
+    return entry["temperature"]
+
+
+def validation_split(source, labels, seed=42):
+    """The validation (uint8 images, labels) of a store or pixel CSV, split the way train.py splits it.
+
+    Rows of classes the model doesn't know are dropped. The images are only
+    unseen by a model trained by train.py on the same data with the same seed
+    (see bundles.held_out_seed()).
+    """
+    from dataset import load_arrays, split_rows
+
+    images, y = load_arrays(source)
+    _, val_rows = split_rows(y, labels, seed=seed)
+    return images[val_rows], y[val_rows]
+
+
+def main():
+    from keras.models import load_model
+
+    from bundles import held_out_seed, resolve_model
+    from preprocessing import pixels_to_batch
+
+    parser = argparse.ArgumentParser(description="Fit a softmax temperature on a bundle's validation split.")
+    parser.add_argument("source", help="The image store or pixel CSV the bundle was trained on, e.g. merged_RGB.dataset")
+    parser.add_argument("--model", required=True, help="Bundle directory written by train.py, e.g. artifacts/hybridcnn/3")
+    parser.add_argument("--out", default="calibration.json")
+    args = parser.parse_args()
+
+    model = resolve_model(args.model)
+    if model["bundle"] is None:
+        raise SystemExit(f"{args.model} is not a train.py bundle; only a bundle has a validation split it never trained on")
+    seed = held_out_seed(model["bundle"], args.source)
+    if seed is None:
+        raise SystemExit(f"{args.source} is not the data {args.model} was trained on (its SHA-256 differs)")
+    X_val, y_val = validation_split(args.source, model["labels"], seed)
+    probabilities = load_model(model["path"]).predict(pixels_to_batch(X_val), batch_size=512, verbose=0)
+
+    temperature = fit_temperature(probabilities, y_val)
+    before = expected_calibration_error(probabilities, y_val)
+    after = expected_calibration_error(apply_temperature(probabilities, temperature), y_val)
+    print(f"{model['name']} {model['version']}: T = {temperature:.3f}, "
+          f"NLL {negative_log_likelihood(probabilities, y_val, 1.0):.4f} -> "
+          f"{negative_log_likelihood(probabilities, y_val, temperature):.4f}, ECE {before:.4f} -> {after:.4f}")
+
+    calibration = load_calibration(args.out)
+    calibration[model["name"]] = {
+        "temperature": temperature,
+        "version": model["version"],
+        "validation_samples": int(len(y_val)),
+        "ece_before": before,
+        "ece_after": after,
+    }
+    with open(args.out, "w") as f:
+        json.dump(calibration, f, indent=2)
+    print(f"Saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from faq import BM25Index, load_faq
+from registry import lazy_import
+
+
+class ChatBackend:
+    """Something that turns a prompt into text, all at once or as a stream of chunks."""
+
+    name = "base"
+
+    def generate(self, prompt):
+        return "".join(self.stream(prompt))
+
+    def stream(self, prompt):
+        raise NotImplementedError
+
+
+class GeminiBackend(ChatBackend):
+    """Google Generative AI, with the client configured and the model built once per process."""
+
+    name = "gemini"
+
+    def __init__(self, model_name, api_key):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    genai = lazy_import("google.generativeai")
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate(self, prompt):
+        return self._get_model().generate_content(prompt).text
+
+    def stream(self, prompt):
+        for chunk in self._get_model().generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackend(ChatBackend):
+    """Offline stand-in for tests and local development: streams a canned answer word by word."""
+
+    name = "fake"
+
+    def __init__(self, delay_seconds=0.0):
+        self.delay = delay_seconds
+        self.calls = 0
+
+    def stream(self, prompt):
+        self.calls += 1
+        question = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+        for word in f"This is a test answer to: {question}".split(" "):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word + " "
+
+
+class FaqBackend(ChatBackend):
+    """Offline answers retrieved from a curated dermatology Q&A corpus with a BM25 index."""
+
+    name = "faq"
+
+    FALLBACK = ("I'm sorry, I don't have an answer to that question. "
+                "Please ask one of our dermatologists during your appointment.")
+
+    def __init__(self, path, min_score=1.0):
+        self.entries = load_faq(path)
+        self.min_score = min_score
+        # Questions are repeated so they weigh more than the answer text
+        self.index = BM25Index([f"{e['question']} {e['question']} {e['answer']}" for e in self.entries])
+
+    def generate(self, prompt):
+        # Only the patient's question is matched, not any context lines prepended to the prompt
+        lines = prompt.strip().splitlines()
+        question = lines[-1] if lines else ""
+        matches = self.index.search(question, top_k=1)
+        if not matches or matches[0][0] < self.min_score:
+            # A vague follow-up like "is it serious?" is probably about the diagnosis, if there is one
+            diagnosis = [line for line in lines if line.startswith(DIAGNOSIS_PREFIX)]
+            if diagnosis:
+                matches = self.index.search(f"{question} {diagnosis[0].split('(')[0]}", top_k=1)
+        if not matches or matches[0][0] < self.min_score:
+            return self.FALLBACK
+        return self.entries[matches[0][1]]["answer"]
+
+    def stream(self, prompt):
+        yield self.generate(prompt)
+
+
+def normalize_prompt(prompt):
+    """Collapse case, whitespace and trailing punctuation so trivially different questions share a cache entry."""
+    return re.sub(r"\s+", " ", prompt.strip().lower()).rstrip(" ?!.")
+
+
+def cache_key(question, class_name=None, history=()):
+    """Response cache key for a question asked about a diagnosed class after the given turns.
+
+    The rendered probabilities are left out, so patients with the same
+    diagnosis asking the same question share one answer.
+    """
+    turns = tuple((normalize_prompt(asked), normalize_prompt(answered)) for asked, answered in history)
+    return class_name, turns, normalize_prompt(question)
+
+
+class ResponseCache:
+    """Bounded LRU cache of chat answers with a time-to-live."""
+
+    def __init__(self, max_entries=512, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+            self._entries.pop(key, None)
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = (text, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class ChatService:
+    """Answer chat prompts through a backend, serving repeated questions from the cache.
+
+    Identical prompts that arrive while one is already being generated wait for
+    that generation instead of starting their own (single-flight). Answers are
+    keyed on the normalized prompt unless the caller passes a key (see cache_key()).
+    """
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.stats = {"generated": 0, "coalesced": 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _join_or_lead(self, key):
+        """Return (future, True) if the caller should generate the answer, or (future, False) to wait on it."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self.stats["generated"] += 1
+            return future, True
+
+    def _finish(self, key, future, text=None, error=None):
+        if text is not None:
+            self.cache.put(key, text)
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(text)
+
+    def answer(self, prompt, key=None):
+        key = key or normalize_prompt(prompt)
+        text = self.cache.get(key)
+        if text is not None:
+            return text
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            return future.result()
+        try:
+            text = self.backend.generate(prompt)
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, text=text)
+        return text
+
+    def stream(self, prompt, key=None):
+        """Yield the answer in chunks as the backend produces them; cached or coalesced answers come back as one chunk."""
+        key = key or normalize_prompt(prompt)
+        text = self.cache.get(key)
+        if text is not None:
+            yield text
+            return
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            yield future.result()
+            return
+        parts = []
+        try:
+            for chunk in self.backend.stream(prompt):
+                parts.append(chunk)
+                yield chunk
+        except BaseException as e:
+            # Includes the client going away mid-stream; waiting callers get an error rather than hang
+            self._finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("Stream interrupted"))
+            raise
+        self._finish(key, future, text="".join(parts))
+
+
+DIAGNOSIS_PREFIX = "The patient's uploaded image was classified as"
+
+PREAMBLE = ("You are a helpful assistant for Pratish Clinic's skin cancer screening service. "
+            "Answer the patient's question in plain language, be honest that the screening model can be "
+            "wrong, and recommend seeing a dermatologist for anything concerning.")
+
+
+def class_snippets(entries):
+    """Map each class name to the background text of the FAQ entries tagged with it."""
+    snippets = {}
+    for entry in entries:
+        for class_name in entry.get("classes", []):
+            snippets[class_name] = entry["answer"]
+    return snippets
+
+
+def build_context(class_name, top_predictions, snippet):
+    """Render the diagnosis context: the predicted class, its top predictions and background on it."""
+    ranked = ", ".join(f"{name} {probability:.0%}" for name, probability in top_predictions)
+    lines = [PREAMBLE, f"{DIAGNOSIS_PREFIX} {class_name} (top predictions: {ranked})."]
+    if snippet:
+        lines.append(f"Background on {class_name}: {snippet}")
+    return "\n".join(lines)
+
+
+def build_prompt(question, context=None, history=(), max_turns=3, max_turn_chars=300):
+    """Assemble a prompt from the diagnosis context, a short window of recent turns and the question.
+
+    The prompt size stays bounded however long the conversation gets. The
+    question is always the last line, which is what the FAQ backend matches on.
+    """
+    lines = [context] if context else []
+    recent = list(history)[-max_turns:]
+    if recent:
+        lines.append("Recent conversation:")
+        for asked, answered in recent:
+            lines.append(f"Patient: {asked[:max_turn_chars]}")
+            lines.append(f"Assistant: {answered[:max_turn_chars]}")
+    if lines:
+        lines.append("Patient question:")
+    lines.append(" ".join(question.split()))
+    return "\n".join(lines)
+
+
+def create_backend(name, model_name=None, api_key=None, faq_path="faq.json"):
+    """Build the chat backend selected by CHAT_BACKEND: gemini, faq or fake."""
+    if name == "gemini":
+        return GeminiBackend(model_name, api_key)
+    if name == "faq":
+        return FaqBackend(faq_path)
+    if name == "fake":
+        return FakeBackend()
+    raise ValueError(f"Unknown chat backend '{name}'")
+
+
+def sse(chunks):
+    """Wrap text chunks as Server-Sent Events, ending with a 'done' event."""
+    for chunk in chunks:
+        # Each line of a chunk needs its own data: field
+        yield "".join(f"data: {line}\n" for line in chunk.split("\n")) + "\n"
+    yield "event: done\ndata: \n\n"
@@ -0,0 +1,67 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+def configure_connection(conn, busy_timeout_ms=5000):
+    """Apply the pragmas every connection to the app database should use."""
+    # WAL lets readers carry on while a booking is being written
+    conn.execute("PRAGMA journal_mode=WAL")
+    # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Wait for a competing writer instead of failing with "database is locked"
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    conn.execute("PRAGMA foreign_keys=ON")
+
+
+class Database:
+    """Access to the app's SQLite database through one long-lived connection per thread.
+
+    Each connection keeps its own cache of compiled statements, so repeated
+    queries are only prepared once per thread.
+    """
+
+    def __init__(self, path, busy_timeout_ms=5000, cached_statements=256):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                   cached_statements=self.cached_statements,
+                                   isolation_level=None)  # autocommit; transactions are explicit
+            configure_connection(conn, self.busy_timeout_ms)
+            self._local.conn = conn
+        return conn
+
+    def execute(self, query, params=()):
+        """Run a single statement in autocommit mode and return the cursor."""
+        return self.connection().execute(query, params)
+
+    def fetchone(self, query, params=()):
+        return self.execute(query, params).fetchone()
+
+    def fetchall(self, query, params=()):
+        return self.execute(query, params).fetchall()
+
+    @contextmanager
+    def transaction(self, mode="DEFERRED"):
+        """Run the block in one transaction; IMMEDIATE takes the write lock up front."""
+        conn = self.connection()
+        conn.execute(f"BEGIN {mode}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
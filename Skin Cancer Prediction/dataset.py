@@ -0,0 +1,205 @@
+"""Binary image store replacing the 2352-column pixel CSVs.
+
+A store is a directory holding images.npy (uint8, N x 28 x 28 x 3),
+labels.npy (int64, N) and meta.json. The arrays are opened memory-mapped, so
+loading is near-instant and nothing is copied until it is used:
+
+    python dataset.py convert dataset/normal.dataset hmnist_28_28_RGB.csv --out merged_RGB.dataset
+    python dataset.py info merged_RGB.dataset
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from preprocessing import TARGET_SIZE, CHANNELS, pixels_to_batch
+
+FORMAT = "skin-image-store"
+FORMAT_VERSION = 1
+IMAGE_SHAPE = (TARGET_SIZE[1], TARGET_SIZE[0], CHANNELS)
+
+
+class Dataset:
+    """A store opened read-only; images and labels are memory-mapped views."""
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.metadata = json.load(f)
+        if self.metadata.get("format") != FORMAT or self.metadata.get("version", 0) > FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} {FORMAT}")
+        count = self.metadata["count"]
+        # Stores can be preallocated larger than what was written; only the first count rows are valid
+        self.images = np.load(os.path.join(path, "images.npy"), mmap_mode=mmap_mode)[:count]
+        self.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode=mmap_mode)[:count]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def batch(self, indices):
+        """Float32 model input for the given rows, scaled to [0, 1]."""
+        return pixels_to_batch(self.images[indices])
+
+    def iter_batches(self, batch_size):
+        """Yield (float32 batch, labels) slices in order, reading only the pages each one touches."""
+        for start in range(0, len(self), batch_size):
+            yield pixels_to_batch(self.images[start:start + batch_size]), np.asarray(self.labels[start:start + batch_size])
+
+
+def open_dataset(path, mmap_mode='r'):
+    return Dataset(path, mmap_mode)
+
+
+def is_dataset(path):
+    return os.path.isfile(os.path.join(path, "meta.json"))
+
+
+class DatasetWriter:
+    """Fill a preallocated store row by row, then publish it atomically.
+
+    The arrays are written to a temporary directory that replaces path on close(),
+    so readers never see a half-written store.
+    """
+
+    def __init__(self, path, capacity, image_shape=IMAGE_SHAPE):
+        self.path = os.path.normpath(path)
+        self.capacity = capacity
+        self.count = 0
+        self._tmp = self.path + ".tmp"
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        os.makedirs(self._tmp)
+        self.images = np.lib.format.open_memmap(os.path.join(self._tmp, "images.npy"), mode='w+',
+                                                dtype=np.uint8, shape=(capacity,) + tuple(image_shape))
+        self.labels = np.lib.format.open_memmap(os.path.join(self._tmp, "labels.npy"), mode='w+',
+                                                dtype=np.int64, shape=(capacity,))
+
+    def append(self, images, labels):
+        """Copy a chunk of uint8 images (any shape that reshapes to N x 28 x 28 x 3) and their labels."""
+        n = len(labels)
+        if self.count + n > self.capacity:
+            raise ValueError(f"Store is full ({self.capacity} rows)")
+        self.images[self.count:self.count + n] = np.asarray(images, dtype=np.uint8).reshape((n,) + self.images.shape[1:])
+        self.labels[self.count:self.count + n] = labels
+        self.count += n
+
+    def close(self, files=None, **metadata):
+        """Flush the arrays, write meta.json and move the store into place; returns its metadata.
+
+        files maps extra file names to JSON content stored alongside, e.g. an ingestion manifest.
+        """
+        self.images.flush()
+        self.labels.flush()
+        labels, counts = np.unique(self.labels[:self.count], return_counts=True)
+        meta = {
+            "format": FORMAT,
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "image_shape": list(self.images.shape[1:]),
+            "dtype": "uint8",
+            "class_counts": {str(int(label)): int(n) for label, n in zip(labels, counts)},
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        meta.update(metadata)
+        with open(os.path.join(self._tmp, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        for name, content in (files or {}).items():
+            with open(os.path.join(self._tmp, name), "w") as f:
+                json.dump(content, f)
+        del self.images, self.labels
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._tmp, self.path)
+        return meta
+
+
+def _count_rows(csv_path):
+    """Data rows in a CSV, counted from the raw bytes, which is far cheaper than parsing."""
+    lines = 0
+    last = b'\n'
+    with open(csv_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            lines += chunk.count(b'\n')
+            last = chunk[-1:]
+    # A final line without a trailing newline still counts; the header line doesn't
+    return lines + (last != b'\n') - 1
+
+
+def csv_to_dataset(csv_paths, out, chunk_size=4096):
+    """Concatenate hmnist-style pixel CSVs (pixel0000..pixel2351 + label) and/or existing stores into one store."""
+    import pandas as pd
+
+    capacity = sum(len(open_dataset(path)) if is_dataset(path) else _count_rows(path) for path in csv_paths)
+    writer = DatasetWriter(out, capacity)
+    for path in csv_paths:
+        if is_dataset(path):
+            data = open_dataset(path)
+            for start in range(0, len(data), chunk_size):
+                writer.append(data.images[start:start + chunk_size], data.labels[start:start + chunk_size])
+            continue
+        for frame in pd.read_csv(path, chunksize=chunk_size):
+            labels = frame.pop('label').to_numpy()
+            writer.append(frame.to_numpy(dtype=np.uint8), labels)
+    return writer.close(sources=[os.path.basename(os.path.normpath(path)) for path in csv_paths])
+
+
+def load_arrays(source):
+    """Return (uint8 N x 28 x 28 x 3 images, labels) from a store or a pixel CSV."""
+    if is_dataset(source):
+        data = open_dataset(source)
+        return data.images, np.asarray(data.labels)
+    import pandas as pd
+    frame = pd.read_csv(source)
+    labels = frame.pop('label').to_numpy()
+    return frame.to_numpy(dtype=np.uint8).reshape((-1,) + IMAGE_SHAPE), labels
+
+
+def fingerprint(source):
+    """SHA-256 over a store's arrays or a CSV's bytes, to record exactly which data a model saw."""
+    paths = [os.path.join(source, "images.npy"), os.path.join(source, "labels.npy")] if is_dataset(source) else [source]
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_rows(labels, known_labels=None, test_size=0.2, seed=42):
+    """Stratified (train rows, validation rows) over the raw rows, in ascending order.
+
+    Row numbers are split rather than arrays, so a memory-mapped store is only
+    read where the rows are used. Rows whose label isn't in known_labels are dropped.
+    """
+    from sklearn.model_selection import train_test_split
+
+    labels = np.asarray(labels)
+    rows = np.arange(len(labels)) if known_labels is None else np.flatnonzero(np.isin(labels, list(known_labels)))
+    train_rows, val_rows = train_test_split(rows, test_size=test_size, random_state=seed, stratify=labels[rows])
+    return np.sort(train_rows), np.sort(val_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect memory-mapped image stores.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Convert pixel CSVs (or other stores) into one store")
+    convert.add_argument("csv", nargs="+")
+    convert.add_argument("--out", required=True, help="Store directory to create, e.g. merged_RGB.dataset")
+    convert.add_argument("--chunk-size", type=int, default=4096, help="CSV rows parsed at a time")
+    info = commands.add_parser("info", help="Print a store's metadata")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        start = time.perf_counter()
+        meta = csv_to_dataset(args.csv, args.out, args.chunk_size)
+        print(f"Wrote {meta['count']} images to {args.out} in {time.perf_counter() - start:.1f}s")
+    else:
+        print(json.dumps(open_dataset(args.path).metadata, indent=2))
+
+
+if __name__ == '__main__':
+    main()
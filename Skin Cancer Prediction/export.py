@@ -0,0 +1,198 @@
+"""Export compressed TFLite variants of a model for CPU serving, with an accuracy and latency report.
+
+Variants are written next to the model (e.g. skin_cancerr-int8.tflite) and the
+web app registers them as "<name>-<variant>", e.g. ?model=hybridcnn-int8:
+
+    python export.py hybridcnn merged_RGB.dataset
+    python export.py artifacts/hybridcnn/2 merged_RGB.dataset --variants dynamic,int8,pruned --sparsity 0.5
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras.models import load_model
+
+from bundles import held_out_seed, resolve_model
+from dataset import load_arrays, split_rows
+from inference import FunctionEngine, TFLiteEngine, convert_to_tflite
+from models import VARIANTS, variant_path
+from pipeline import training_dataset, steps_per_epoch
+from preprocessing import pixels_to_batch
+
+
+def representative_dataset(images, rows, samples, seed):
+    """Calibration inputs for full-integer quantization: a random sample of training images, one at a time."""
+    rng = np.random.default_rng(seed)
+    chosen = np.sort(rng.choice(rows, size=min(samples, len(rows)), replace=False))
+
+    def generate():
+        for row in chosen:
+            yield [pixels_to_batch(images[row:row + 1])]
+
+    return generate
+
+
+def prune(model, images, labels, train_rows, sparsity, epochs, batch_size, seed):
+    """Magnitude-prune the Conv2D and Dense kernels to the given sparsity, fine-tuning briefly so accuracy recovers."""
+    try:
+        import tensorflow_model_optimization as tfmot
+    except ImportError:
+        raise SystemExit("The pruned variant needs tensorflow-model-optimization (pip install tensorflow-model-optimization)")
+
+    schedule = tfmot.sparsity.keras.ConstantSparsity(sparsity, begin_step=0, frequency=50)
+
+    def wrap(layer):
+        # The LSTM and normalization layers are left dense
+        if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense)):
+            return tfmot.sparsity.keras.prune_low_magnitude(layer, pruning_schedule=schedule)
+        return layer
+
+    # clone_model with a clone_function reuses the original layers, and so their weights; wrapping a fresh copy
+    # keeps the pruning out of the model the other variants are converted from
+    copy = tf.keras.models.clone_model(model)
+    copy.set_weights(model.get_weights())
+    pruned = tf.keras.models.clone_model(copy, clone_function=wrap)
+    pruned.compile(optimizer=tf.keras.optimizers.Adam(1e-4), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    pruned.fit(training_dataset(images, labels, train_rows, batch_size, seed=seed),
+               steps_per_epoch=steps_per_epoch(train_rows, batch_size), epochs=epochs,
+               callbacks=[tfmot.sparsity.keras.UpdatePruningStep()], verbose=2)
+    return tfmot.sparsity.keras.strip_pruning(pruned)
+
+
+def current_rss_mb():
+    # Resident set size right now (not the peak), so the cost of loading one engine can be measured
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def gzip_size(path):
+    # Pruned weights only shrink the artifact once compressed, which is how they would be shipped
+    with open(path, 'rb') as f:
+        return len(gzip.compress(f.read()))
+
+
+def evaluate(engine, X_val, y_val, requests, batch_size=256):
+    """Accuracy, predictions, single-image latency and batch throughput of an engine on the validation split."""
+    engine.predict(X_val[:1])
+    latencies = []
+    for i in range(min(requests, len(X_val))):
+        start = time.perf_counter()
+        engine.predict(X_val[i:i + 1])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    probabilities = np.concatenate([engine.predict(X_val[i:i + batch_size]) for i in range(0, len(X_val), batch_size)])
+    seconds = time.perf_counter() - start
+    predicted = probabilities.argmax(axis=1)
+    return predicted, {
+        "accuracy": float(np.mean(predicted == y_val)),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "images_per_second": len(X_val) / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export quantized (and optionally pruned) TFLite variants of a model.")
+    parser.add_argument("target", help="Shipped model name, bundle directory or model file")
+    parser.add_argument("source", help="Image store or pixel CSV the model was trained on, e.g. merged_RGB.dataset")
+    parser.add_argument("--variants", default="dynamic,int8", help=f"Comma-separated, from {', '.join(VARIANTS)}")
+    parser.add_argument("--representative", type=int, default=500, help="Training images used to calibrate int8 ranges")
+    parser.add_argument("--sparsity", type=float, default=0.5, help="Fraction of Conv2D/Dense weights pruned")
+    parser.add_argument("--prune-epochs", type=int, default=2, help="Fine-tuning epochs while pruning")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="Single-image requests timed per variant")
+    parser.add_argument("--seed", type=int, default=42, help="Split seed, unless the target is a bundle trained on source")
+    args = parser.parse_args()
+
+    variants = args.variants.split(",")
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        raise SystemExit(f"Unknown variants: {', '.join(sorted(unknown))}")
+
+    target = resolve_model(args.target)
+    name, model_path = target["name"], target["path"]
+    seed = held_out_seed(target["bundle"], args.source)
+    held_out = seed is not None
+    if not held_out:
+        seed = args.seed
+        print(f"Warning: {args.target} was not trained by train.py on {args.source}, so the validation images may "
+              f"have been training images; absolute accuracies are inflated, the deltas between variants still hold")
+    images, labels = load_arrays(args.source)
+    labels = np.asarray(labels)
+    train_rows, val_rows = split_rows(labels, target["labels"], seed=seed)
+    X_val, y_val = pixels_to_batch(images[val_rows]), labels[val_rows]
+
+    rss = current_rss_mb()
+    model = load_model(model_path)
+    engine = FunctionEngine(model)
+    baseline_predicted, baseline = evaluate(engine, X_val, y_val, args.requests)
+    baseline.update(file_bytes=os.path.getsize(model_path), gzip_bytes=gzip_size(model_path),
+                    rss_mb=current_rss_mb() - rss)
+    report = {"model": name, "path": model_path, "validation_samples": int(len(y_val)), "held_out": held_out,
+              "original": baseline, "variants": {}}
+
+    for variant in variants:
+        start = time.perf_counter()
+        try:
+            if variant == "dynamic":
+                flatbuffer = convert_to_tflite(model, optimizations=[tf.lite.Optimize.DEFAULT])
+            elif variant == "int8":
+                flatbuffer = convert_to_tflite(
+                    model, optimizations=[tf.lite.Optimize.DEFAULT],
+                    representative_dataset=representative_dataset(images, train_rows, args.representative, seed),
+                    int8=True)
+            else:
+                pruned = prune(model, images, labels, train_rows, args.sparsity, args.prune_epochs, args.batch_size,
+                               seed)
+                flatbuffer = convert_to_tflite(pruned, optimizations=[tf.lite.Optimize.DEFAULT])
+            export_seconds = time.perf_counter() - start
+            # Load it the way the web app will, so a flatbuffer the interpreter can't allocate is never registered
+            rss = current_rss_mb()
+            engine = TFLiteEngine(model_content=flatbuffer)
+        except Exception as e:
+            # e.g. an op with no int8 kernel; the other variants are still worth having
+            print(f"{variant}: conversion failed: {e}")
+            report["variants"][variant] = {"error": str(e)}
+            # A file left by an earlier export would otherwise still be served under this variant
+            stale = variant_path(model_path, variant)
+            if os.path.exists(stale):
+                os.remove(stale)
+            continue
+
+        path = variant_path(model_path, variant)
+        with open(path, 'wb') as f:
+            f.write(flatbuffer)
+        predicted, result = evaluate(engine, X_val, y_val, args.requests)
+        result.update(
+            path=path,
+            file_bytes=os.path.getsize(path),
+            gzip_bytes=gzip_size(path),
+            rss_mb=current_rss_mb() - rss,
+            accuracy_delta=result["accuracy"] - baseline["accuracy"],
+            agreement=float(np.mean(predicted == baseline_predicted)),
+            export_seconds=export_seconds,
+        )
+        report["variants"][variant] = result
+
+    print(f"{name}: {len(y_val)} validation images")
+    print(f"{'':>10} {'accuracy':>9} {'delta':>8} {'agree':>6} {'p50 ms':>7} {'p99 ms':>7} {'img/s':>8} "
+          f"{'size KB':>8} {'gzip KB':>8} {'RSS MB':>7}")
+    rows = [("original", baseline)] + [(v, r) for v, r in report["variants"].items() if "error" not in r]
+    for label, r in rows:
+        print(f"{label:>10} {r['accuracy']:9.4f} {r.get('accuracy_delta', 0.0):+8.4f} {r.get('agreement', 1.0):6.3f} "
+              f"{r['p50_ms']:7.2f} {r['p99_ms']:7.2f} {r['images_per_second']:8.0f} "
+              f"{r['file_bytes'] / 1024:8.0f} {r['gzip_bytes'] / 1024:8.0f} {r['rss_mb']:7.1f}")
+
+    report_path = f"{os.path.splitext(model_path)[0]}-export.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import json
+import math
+import re
+from collections import Counter
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in",
+    "is", "it", "my", "of", "on", "or", "should", "the", "this", "to", "what", "when", "which", "with", "you",
+}
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+def load_faq(path):
+    """Load the curated Q&A corpus: a list of {"question", "answer", optional "classes"} entries."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class BM25Index:
+    """Okapi BM25 ranking over a small in-memory corpus of documents."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(doc)) for doc in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def search(self, query, top_k=1):
+        """Return [(score, document index)] for the best matches, highest score first."""
+        terms = tokenize(query)
+        scores = []
+        for i, counts in enumerate(self.term_counts):
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term)
+                if not tf:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                score += self.idf[term] * tf * (self.k1 + 1) / norm
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return scores[:top_k]
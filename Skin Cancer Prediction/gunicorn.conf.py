@@ -0,0 +1,30 @@
+import gc
+import importlib
+import os
+
+# Import the app once in the master, then fork the workers. TensorFlow is not
+# fork-safe (its thread pools would be copied into the workers mid-state), so the
+# master must not load any models or start any threads: the app's import is kept
+# free of both, and each worker runs the app's start_services() after the fork,
+# which also loads the models there when PRELOAD_MODELS=1.
+#   gunicorn -c gunicorn.conf.py test:app
+preload_app = True
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+
+def pre_fork(server, worker):
+    # Move the objects created by the app import out of the collector's reach, so
+    # the workers' garbage collection doesn't touch (and copy) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Per-worker startup: database tables, mail workers and, optionally, the models
+    module = importlib.import_module(server.app.app_uri.split(":")[0])
+    if hasattr(module, "start_services"):
+        module.start_services()
+    from registry import timings
+    server.log.info("Worker %s started, startup timings: %s", worker.pid,
+                    {name: round(seconds, 3) for name, seconds in timings.items()})
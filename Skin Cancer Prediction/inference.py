@@ -0,0 +1,184 @@
+import argparse
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+INPUT_SHAPE = (28, 28, 3)
+
+
+class InferenceEngine:
+    """Run a batch of preprocessed images through a model and return class probabilities."""
+
+    name = "base"
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+
+class KerasEngine(InferenceEngine):
+    """The original path: Keras model.predict() on every call."""
+
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+
+class FunctionEngine(InferenceEngine):
+    """Call the model directly under a tf.function traced once for a fixed input signature."""
+
+    name = "function"
+
+    def __init__(self, model):
+        self.model = model
+        self._forward = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32)],
+        )
+        # Trace now so the first request doesn't pay for it
+        self._forward(tf.zeros((1,) + INPUT_SHAPE, tf.float32))
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return self._forward(tf.convert_to_tensor(batch)).numpy()
+
+
+class TFLiteEngine(InferenceEngine):
+    """Run a TFLite flatbuffer, either converted from a Keras model or loaded from a .tflite file."""
+
+    name = "tflite"
+
+    def __init__(self, model=None, model_path=None, model_content=None):
+        if model_path is None and model_content is None:
+            model_content = convert_to_tflite(model)
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, model_content=model_content)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = self._input['shape'][0]
+        # The interpreter keeps its tensors in shared buffers, so only one caller may invoke it at a time
+        self._lock = threading.Lock()
+
+    def _quantize(self, batch):
+        scale, zero_point = self._input['quantization']
+        if self._input['dtype'] == np.float32 or scale == 0:
+            return batch.astype(self._input['dtype'])
+        # Clip before the cast, so inputs just outside the calibrated range saturate instead of wrapping around
+        info = np.iinfo(self._input['dtype'])
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(self._input['dtype'])
+
+    def _dequantize(self, output):
+        scale, zero_point = self._output['quantization']
+        if self._output['dtype'] == np.float32 or scale == 0:
+            return output.astype(np.float32)
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            # Resizing reallocates tensors, so only do it when the batch size actually changes
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output['index']))
+
+
+def unroll_rnns(model):
+    """Copy of the model with its RNN layers unrolled, or the model itself if it has none.
+
+    A rolled LSTM converts to a while loop over TensorList ops, which only run with the Flex delegate that the
+    stock tf.lite.Interpreter doesn't have; unrolled, HybridNN's one-step LSTM is plain builtin (and int8) ops.
+    """
+    if not any(isinstance(layer, tf.keras.layers.RNN) for layer in model.layers):
+        return model
+
+    def clone(layer):
+        config = layer.get_config()
+        if isinstance(layer, tf.keras.layers.RNN):
+            config["unroll"] = True
+        return layer.__class__.from_config(config)
+
+    unrolled = tf.keras.models.clone_model(model, clone_function=clone)
+    unrolled.set_weights(model.get_weights())
+    return unrolled
+
+
+def convert_to_tflite(model, optimizations=None, representative_dataset=None, int8=False):
+    """Convert a Keras model to a TFLite flatbuffer that runs on builtin ops only."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(unroll_rnns(model))
+    # No SELECT_TF_OPS: a model that needs them should fail here rather than when the interpreter is allocated
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    if optimizations:
+        converter.optimizations = optimizations
+    if representative_dataset is not None:
+        converter.representative_dataset = representative_dataset
+    if int8:
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+BACKENDS = {
+    KerasEngine.name: KerasEngine,
+    FunctionEngine.name: FunctionEngine,
+    TFLiteEngine.name: TFLiteEngine,
+}
+
+
+def create_engine(model, backend="function"):
+    """Build the inference engine selected at startup (keras, function or tflite)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](model)
+
+
+def is_tflite(path):
+    return path.endswith('.tflite')
+
+
+def engine_from_path(path, backend="function"):
+    """Build an engine straight from an artifact: .tflite files always use the TFLite interpreter."""
+    if is_tflite(path):
+        return TFLiteEngine(model_path=path)
+    from keras.models import load_model
+    return create_engine(load_model(path), backend)
+
+
+def check_parity(model, engine, samples=64, atol=1e-4, seed=0):
+    """Compare an engine against Keras model.predict() on random inputs and return the max abs difference."""
+    rng = np.random.default_rng(seed)
+    batch = rng.random((samples,) + INPUT_SHAPE, dtype=np.float32)
+    expected = model.predict(batch, verbose=0)
+    actual = engine.predict(batch)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    labels_match = bool(np.array_equal(np.argmax(expected, axis=1), np.argmax(actual, axis=1)))
+    if max_diff > atol or not labels_match:
+        raise AssertionError(f"{engine.name} backend differs from model.predict(): "
+                             f"max abs diff {max_diff:.2e}, labels match: {labels_match}")
+    return max_diff
+
+
+if __name__ == '__main__':
+    from keras.models import load_model
+
+    parser = argparse.ArgumentParser(description="Check an inference backend against Keras model.predict().")
+    parser.add_argument("--model", default="./skin_cancerr.h5")
+    parser.add_argument("--backend", default="function", choices=sorted(BACKENDS))
+    parser.add_argument("--samples", type=int, default=64)
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    engine = create_engine(model, args.backend)
+    diff = check_parity(model, engine, samples=args.samples, atol=args.atol)
+    print(f"{args.backend} backend matches model.predict() (max abs diff {diff:.2e})")
@@ -0,0 +1,154 @@
+"""Incremental, parallel ingestion of image files into an image store (see dataset.py).
+
+Files are decoded and resized on a process pool and written straight into the
+store's preallocated uint8 array. A content-hash manifest is kept next to the
+arrays, so re-running only decodes files that are new or have changed:
+
+    python ingest.py dataset/train/ --out dataset/normal.dataset --label 7
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from batch import decode_image, is_image_name
+from dataset import DatasetWriter, is_dataset, open_dataset
+
+MANIFEST = "manifest.json"
+
+
+def _decode(task):
+    """Runs in a worker process: hash one file and, unless the hash is already known, decode it."""
+    path, known_hash = task
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return path, None, None, str(e)
+    digest = hashlib.sha256(data).hexdigest()
+    if digest == known_hash:
+        # Touched but not changed: the store already holds these pixels
+        return path, digest, None, None
+    try:
+        return path, digest, decode_image(io.BytesIO(data)), None
+    except (ValueError, OSError) as e:
+        return path, digest, None, str(e)
+
+
+def load_manifest(store):
+    """{path: {"sha256", "size", "mtime_ns", "row", "error"}} for a store built by ingest(), else {}."""
+    path = os.path.join(store, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def ingest(paths, out, label, workers=None, chunksize=64):
+    """Bring the store at out up to date with paths, all given the same label; returns a summary dict."""
+    paths = list(dict.fromkeys(os.path.normpath(p) for p in paths))
+    old_manifest = load_manifest(out) if is_dataset(out) else {}
+    old = open_dataset(out) if old_manifest else None
+
+    manifest = {}
+    unchanged = {}
+    tasks = []
+    for path in paths:
+        entry = old_manifest.get(path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            manifest[path] = {"sha256": None, "size": None, "mtime_ns": None, "row": None, "error": str(e)}
+            continue
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            # Same size and modification time: trust the recorded hash without reading the file
+            unchanged[path] = entry
+        else:
+            tasks.append((path, entry["sha256"] if entry else None))
+        manifest[path] = {"sha256": None, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "row": None, "error": None}
+
+    writer = DatasetWriter(out, capacity=len(paths))
+    reused = decoded = failed = 0
+    carried = []
+
+    def keep(path, entry):
+        manifest[path].update(sha256=entry["sha256"], error=entry["error"])
+        if entry["row"] is not None:
+            manifest[path]["row"] = writer.count + len(carried)
+            carried.append(entry["row"])
+
+    def flush():
+        # Consecutive rows for files that haven't changed are copied over from the previous store in one go
+        nonlocal reused
+        if carried:
+            writer.append(old.images[carried], [label] * len(carried))
+            reused += len(carried)
+            carried.clear()
+
+    with multiprocessing.Pool(workers) if tasks else contextlib.nullcontext() as pool:
+        # Both in path order, so rows come out exactly as a fresh build would write them
+        results = pool.imap(_decode, tasks, chunksize=chunksize) if tasks else iter(())
+        for path in paths:
+            if path in unchanged:
+                keep(path, unchanged[path])
+                continue
+            if manifest[path]["error"] is not None:
+                continue
+            _, digest, pixels, error = next(results)
+            if digest is not None and pixels is None and error is None:
+                keep(path, old_manifest[path])
+                continue
+            manifest[path].update(sha256=digest, error=error)
+            if pixels is None:
+                print(f"Skipping unreadable image {path}: {error}")
+                failed += 1
+                continue
+            flush()
+            manifest[path]["row"] = writer.count
+            writer.append(pixels[np.newaxis], [label])
+            decoded += 1
+        flush()
+
+    old = None
+    meta = writer.close(files={MANIFEST: manifest}, sources=["ingest"])
+    return {"images": meta["count"], "reused": reused, "decoded": decoded, "failed": failed,
+            "removed": len(set(old_manifest) - set(manifest))}
+
+
+def list_images(source, column="file_location", root=""):
+    """Image paths from a directory tree, or from a path column of a CSV such as dataset/train.csv."""
+    if os.path.isdir(source):
+        for dirpath, _, filenames in os.walk(source):
+            for filename in sorted(filenames):
+                if is_image_name(filename):
+                    yield os.path.join(dirpath, filename)
+    else:
+        import pandas as pd
+        for path in pd.read_csv(source, usecols=[column])[column]:
+            yield os.path.join(root, str(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest image files into an image store, skipping unchanged files.")
+    parser.add_argument("source", help="Directory of images, or a CSV listing them")
+    parser.add_argument("--out", required=True, help="Store directory, e.g. dataset/normal.dataset")
+    parser.add_argument("--label", type=int, required=True, help="Label given to every image, e.g. 7 for the normal class")
+    parser.add_argument("--column", default="file_location", help="CSV column holding the image paths")
+    parser.add_argument("--root", default="", help="Directory the CSV paths are relative to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Decode processes")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = ingest(list_images(args.source, args.column, args.root), args.out, args.label, args.workers)
+    print(f"{args.out}: {summary['images']} images ({summary['decoded']} decoded, {summary['reused']} unchanged, "
+          f"{summary['failed']} unreadable, {summary['removed']} removed) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
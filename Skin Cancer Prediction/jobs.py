@@ -0,0 +1,172 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tta import predict_tta
+
+# Engines loaded inside each worker process, keyed by model path
+_worker_engines = {}
+
+
+def _predict_job(model_path, img_array, tta_views=1):
+    """Runs in a worker process: load the model once per process and predict one batch."""
+    if model_path not in _worker_engines:
+        from inference import engine_from_path
+        _worker_engines[model_path] = engine_from_path(model_path, os.getenv("INFERENCE_BACKEND", "function"))
+    return predict_tta(_worker_engines[model_path].predict, img_array, tta_views)
+
+
+def _results(labels, prediction):
+    """JSON for a job's result: the class and probabilities of each predicted row."""
+    return json.dumps([{
+        "class_name": labels.get(int(np.argmax(row))),
+        "probabilities": {labels.get(i, str(i)): float(p) for i, p in enumerate(row)},
+    } for row in prediction])
+
+
+class JobQueue:
+    """Run diagnosis jobs on a local process pool and keep their state in SQLite.
+
+    The store is a plain SQLite file, so any web worker can answer a status poll
+    for a job submitted through another one.
+    """
+
+    def __init__(self, db_path, workers=2, ttl_seconds=86400):
+        self.db_path = db_path
+        self.workers = workers
+        # Finished jobs (and queued ones whose worker died) are deleted after this long
+        self.ttl = ttl_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._last_prune = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        # The table is created on first use rather than on construction, so merely importing the app is side-effect free
+        if not self._table_ready:
+            self._create_table(conn)
+            self._table_ready = True
+        return conn
+
+    def _create_table(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                            id TEXT PRIMARY KEY,
+                            status TEXT NOT NULL,
+                            model TEXT NOT NULL,
+                            result TEXT,
+                            error TEXT,
+                            created REAL NOT NULL,
+                            finished REAL
+                        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished)")
+        conn.commit()
+
+    def prune(self):
+        """Delete jobs that finished more than ttl seconds ago, and queued ones that never finished within it."""
+        cutoff = time.time() - self.ttl
+        conn = self._connect()
+        deleted = conn.execute("DELETE FROM jobs WHERE finished < ? OR (finished IS NULL AND created < ?)",
+                               (cutoff, cutoff)).rowcount
+        conn.commit()
+        conn.close()
+        self._last_prune = time.monotonic()
+        return deleted
+
+    def _pool(self):
+        # Created on first use, after any fork by the web server. Spawned (not forked)
+        # workers don't inherit the parent's TensorFlow threads or locks.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, model_name, model_path, labels, img_array, tta_views=1):
+        """Queue a preprocessed (N, 28, 28, 3) array and return the job id straight away.
+
+        With tta_views > 1 each image is predicted as the average over that many augmented views.
+        """
+        job_id = uuid.uuid4().hex
+        # Expire old rows at most once a minute, on the submit path
+        if time.monotonic() - self._last_prune > 60:
+            self.prune()
+        conn = self._connect()
+        conn.execute("INSERT INTO jobs (id, status, model, created) VALUES (?, 'queued', ?, ?)",
+                     (job_id, model_name, time.time()))
+        conn.commit()
+        conn.close()
+
+        future = self._pool().submit(_predict_job, model_path, img_array, tta_views)
+        future.add_done_callback(lambda f: self._finish(job_id, labels, f))
+        return job_id
+
+    def submit_result(self, model_name, labels, prediction):
+        """Record a job that is already done with a known prediction, e.g. a cache hit, and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        conn.execute("INSERT INTO jobs (id, status, model, result, created, finished) VALUES (?, 'done', ?, ?, ?, ?)",
+                     (job_id, model_name, _results(labels, prediction), now, now))
+        conn.commit()
+        conn.close()
+        return job_id
+
+    def _finish(self, job_id, labels, future):
+        try:
+            status, result, error = "done", _results(labels, future.result()), None
+        except Exception as e:
+            status, result, error = "failed", None, str(e)
+        conn = self._connect()
+        conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                     (status, result, error, time.time(), job_id))
+        conn.commit()
+        conn.close()
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if there is no such job."""
+        conn = self._connect()
+        row = conn.execute("SELECT id, status, model, result, error, created, finished FROM jobs WHERE id = ?",
+                           (job_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "model": row[2],
+            "result": json.loads(row[3]) if row[3] else None,
+            "error": row[4],
+            "created": row[5],
+            "finished": row[6],
+        }
+
+    def events(self, job_id, poll_seconds=0.25, timeout=120):
+        """Yield Server-Sent Events with the job state until it finishes."""
+        deadline = time.monotonic() + timeout
+        last_status = None
+        while time.monotonic() < deadline:
+            job = self.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Unknown job'})}\n\n"
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in ("done", "failed"):
+                return
+            time.sleep(poll_seconds)
+        yield f"event: timeout\ndata: {json.dumps({'id': job_id})}\n\n"
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,298 @@
+"""Background email delivery through a persistent outbox table.
+
+Messages are written to the outbox inside the request and sent later by
+worker threads, each keeping one authenticated SMTP session open across many
+messages. Broadcast campaigns go through the same outbox, behind one-off
+messages such as booking confirmations. Nothing is sent until SMTP_HOST and a
+sender (SMTP_USERNAME/SMTP_PASSWORD, or SMTP_SENDER for a server without login)
+are set; until then messages stay queued. For local testing, point
+SMTP_HOST/SMTP_PORT at a stand-in server with SMTP_SSL=0 and SMTP_SENDER set,
+e.g.  python -m aiosmtpd -n -l localhost:8025
+"""
+import os
+import smtplib
+import threading
+import time
+import uuid
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# With a rate limit, a claim holds about this many seconds of sending, so claimed messages never sit long enough
+# to look abandoned to another dispatcher
+CLAIM_SECONDS = 30
+
+
+class MailDispatcher:
+    """Queue emails in the database and deliver them from a background thread with retries."""
+
+    def __init__(self, database, host, port, username=None, password=None, sender=None, use_ssl=True,
+                 max_attempts=5, backoff_seconds=30, idle_seconds=60, poll_seconds=5, batch_size=50,
+                 connections=1, rate_per_minute=0, claim_timeout_seconds=600):
+        self.database = database
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.use_ssl = use_ssl
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.idle_seconds = idle_seconds
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.connections = connections
+        # 0 means unlimited; otherwise messages are spaced out across every dispatcher sharing the database
+        self.rate_per_minute = rate_per_minute
+        # A message claimed but not touched for this long is assumed lost with its dispatcher and sent again
+        self.claim_timeout_seconds = claim_timeout_seconds
+        # Identifies this process's claims, so several web workers never send the same message
+        self.worker_id = uuid.uuid4().hex
+        # Each worker thread keeps its own SMTP session
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    @classmethod
+    def from_env(cls, database):
+        """Build a dispatcher from the SMTP_* environment variables; it stays idle if they are missing."""
+        return cls(
+            database,
+            host=os.getenv("SMTP_HOST"),
+            port=int(os.getenv("SMTP_PORT", "465")),
+            username=os.getenv("SMTP_USERNAME"),
+            password=os.getenv("SMTP_PASSWORD"),
+            sender=os.getenv("SMTP_SENDER"),
+            use_ssl=os.getenv("SMTP_SSL", "1") == "1",
+            connections=int(os.getenv("SMTP_CONNECTIONS", "2")),
+            rate_per_minute=int(os.getenv("SMTP_RATE_PER_MINUTE", "0")),
+        )
+
+    @property
+    def configured(self):
+        """Whether there is a server and sender to deliver with; otherwise messages are only queued."""
+        return bool(self.host and self.sender) and bool(self.password or not self.username)
+
+    def _create_table(self):
+        if self._table_ready:
+            return
+        self._table_ready = True
+        with self.database.transaction("IMMEDIATE") as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS outbox (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                recipient TEXT NOT NULL,
+                                subject TEXT NOT NULL,
+                                body TEXT NOT NULL,
+                                status TEXT NOT NULL DEFAULT 'pending',
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                next_attempt REAL NOT NULL,
+                                claimed_by TEXT,
+                                claimed_at REAL,
+                                last_error TEXT,
+                                created REAL NOT NULL,
+                                sent_at REAL,
+                                campaign_id INTEGER
+                            )''')
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(outbox)")]
+            if 'campaign_id' not in columns:
+                conn.execute("ALTER TABLE outbox ADD COLUMN campaign_id INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_campaign ON outbox (campaign_id, status)")
+            conn.execute('''CREATE TABLE IF NOT EXISTS campaigns (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                subject TEXT NOT NULL,
+                                body TEXT NOT NULL,
+                                description TEXT,
+                                total INTEGER NOT NULL,
+                                created REAL NOT NULL
+                            )''')
+            # One row holding the earliest time the next message may go out, shared by all processes
+            conn.execute('CREATE TABLE IF NOT EXISTS mail_rate (id INTEGER PRIMARY KEY CHECK (id = 1), next_send REAL NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO mail_rate (id, next_send) VALUES (1, 0)")
+
+    def enqueue(self, recipient, subject, body):
+        """Store a message in the outbox and wake the worker; returns the message id."""
+        self._create_table()
+        now = time.time()
+        message_id = self.database.execute(
+            "INSERT INTO outbox (recipient, subject, body, next_attempt, created) VALUES (?, ?, ?, ?, ?)",
+            (recipient, subject, body, now, now)).lastrowid
+        self._ensure_worker()
+        self._wakeup.set()
+        return message_id
+
+    def create_campaign(self, subject, body, recipients, description=None):
+        """Queue one message per recipient as a broadcast campaign and return the campaign id."""
+        self._create_table()
+        now = time.time()
+        recipients = sorted(set(recipients))
+        with self.database.transaction("IMMEDIATE") as conn:
+            campaign_id = conn.execute(
+                "INSERT INTO campaigns (subject, body, description, total, created) VALUES (?, ?, ?, ?, ?)",
+                (subject, body, description, len(recipients), now)).lastrowid
+            conn.executemany(
+                "INSERT INTO outbox (recipient, subject, body, next_attempt, created, campaign_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(recipient, subject, body, now, now, campaign_id) for recipient in recipients])
+        self._ensure_worker()
+        self._wakeup.set()
+        return campaign_id
+
+    def campaign_progress(self, campaign_id):
+        """Return a campaign's details with its messages counted by status, or None if it doesn't exist."""
+        row = self.database.fetchone("SELECT id, subject, description, total, created FROM campaigns WHERE id = ?",
+                                     (campaign_id,))
+        if row is None:
+            return None
+        counts = dict(self.database.fetchall(
+            "SELECT status, COUNT(*) FROM outbox WHERE campaign_id = ? GROUP BY status", (campaign_id,)))
+        done = counts.get('sent', 0) + counts.get('failed', 0)
+        return {
+            "id": row[0],
+            "subject": row[1],
+            "description": row[2],
+            "total": row[3],
+            "created": row[4],
+            "pending": counts.get('pending', 0) + counts.get('sending', 0),
+            "sent": counts.get('sent', 0),
+            "failed": counts.get('failed', 0),
+            "progress": done / row[3] if row[3] else 1.0,
+        }
+
+    def campaigns(self, limit=20):
+        """Progress of the most recent campaigns."""
+        rows = self.database.fetchall("SELECT id FROM campaigns ORDER BY id DESC LIMIT ?", (limit,))
+        return [self.campaign_progress(row[0]) for row in rows]
+
+    def _ensure_worker(self):
+        if not self.configured:
+            return
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.connections:
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def start(self):
+        """Create the tables and start the workers so messages left over from a previous run get delivered."""
+        self._create_table()
+        if not self.configured:
+            print("Mail dispatcher idle: set SMTP_HOST and SMTP_USERNAME/SMTP_PASSWORD (or SMTP_SENDER) to send email; "
+                  "messages are queued until then")
+            return
+        self._ensure_worker()
+
+    def _claim_size(self):
+        if not self.rate_per_minute:
+            return self.batch_size
+        return max(1, min(self.batch_size, int(self.rate_per_minute * CLAIM_SECONDS / 60)))
+
+    def _claim(self):
+        """Atomically mark a batch of due messages as being sent by this worker."""
+        now = time.time()
+        with self.database.transaction("IMMEDIATE") as conn:
+            # Messages claimed by a worker that died mid-send go back to the queue
+            conn.execute("UPDATE outbox SET status = 'pending', claimed_by = NULL "
+                         "WHERE status = 'sending' AND claimed_at < ?", (now - self.claim_timeout_seconds,))
+            # One-off messages (no campaign) jump ahead of broadcast traffic
+            rows = conn.execute("SELECT id, recipient, subject, body, attempts FROM outbox "
+                                "WHERE status = 'pending' AND next_attempt <= ? "
+                                "ORDER BY campaign_id IS NOT NULL, id LIMIT ?",
+                                (now, self._claim_size())).fetchall()
+            if rows:
+                conn.executemany("UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ? WHERE id = ?",
+                                 [(self.worker_id, now, row[0]) for row in rows])
+        return rows
+
+    def _session(self):
+        """Return this thread's authenticated SMTP session, reusing it while it is still alive."""
+        smtp = getattr(self._local, "smtp", None)
+        if smtp is not None:
+            try:
+                smtp.noop()
+                return smtp
+            except (smtplib.SMTPException, OSError):
+                self._close_session()
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=30)
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        self._local.smtp = smtp
+        return smtp
+
+    def _close_session(self):
+        smtp = getattr(self._local, "smtp", None)
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._local.smtp = None
+
+    def _throttle(self):
+        """Block until the next send is allowed under rate_per_minute, counting every process using the database."""
+        if not self.rate_per_minute:
+            return
+        with self.database.transaction("IMMEDIATE") as conn:
+            now = time.time()
+            slot = max(now, conn.execute("SELECT next_send FROM mail_rate WHERE id = 1").fetchone()[0])
+            conn.execute("UPDATE mail_rate SET next_send = ? WHERE id = 1", (slot + 60.0 / self.rate_per_minute,))
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _refresh_claim(self, message_id):
+        """Renew this worker's claim on a message right before sending it; False if it has been taken back."""
+        return self.database.execute(
+            "UPDATE outbox SET claimed_at = ? WHERE id = ? AND status = 'sending' AND claimed_by = ?",
+            (time.time(), message_id, self.worker_id)).rowcount == 1
+
+    def _build(self, recipient, subject, body):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg.as_string()
+
+    def _send_batch(self, rows):
+        for message_id, recipient, subject, body, attempts in rows:
+            self._throttle()
+            if not self._refresh_claim(message_id):
+                continue
+            try:
+                self._session().sendmail(self.sender, recipient, self._build(recipient, subject, body))
+                self.database.execute("UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL "
+                                      "WHERE id = ? AND claimed_by = ?", (time.time(), message_id, self.worker_id))
+            except (smtplib.SMTPException, OSError) as e:
+                # Drop the session in case it is the problem, and retry later with exponential backoff
+                self._close_session()
+                attempts += 1
+                status = 'failed' if attempts >= self.max_attempts else 'pending'
+                next_attempt = time.time() + self.backoff_seconds * 2 ** (attempts - 1)
+                self.database.execute("UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, "
+                                      "claimed_by = NULL WHERE id = ? AND claimed_by = ?",
+                                      (status, attempts, next_attempt, str(e), message_id, self.worker_id))
+                print(f"Failed to send email to {recipient} (attempt {attempts}): {e}")
+            self._local.last_used = time.monotonic()
+
+    def _run(self):
+        while True:
+            try:
+                rows = self._claim()
+                if rows:
+                    self._send_batch(rows)
+                    continue
+            except Exception as e:
+                print(f"Mail dispatcher error: {e}")
+
+            # Nothing due: close an idle session and wait for new mail
+            if time.monotonic() - getattr(self._local, "last_used", 0.0) > self.idle_seconds:
+                self._close_session()
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def stats(self):
+        """Count outbox messages by status."""
+        return dict(self.database.fetchall("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
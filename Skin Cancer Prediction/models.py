@@ -0,0 +1,53 @@
+import os
+
+# Define class labels
+classes = {
+    4: 'Nevus',
+    6: 'Melanoma',
+    2: 'Seborrheic Keratosis',
+    1: 'Basal Cell Carcinoma',
+    5: 'Vascular Lesion',
+    0: 'Actinic Keratosis',
+    3: 'Dermatofibroma',
+    7: 'Normal Class'
+}
+
+# The original DermaNet model was trained without the normal class
+classes_without_normal = {label: name for label, name in classes.items() if label != 7}
+
+# The model artifacts shipped with the repo. The first one is the default
+# unless DEFAULT_MODEL says otherwise.
+SHIPPED_MODELS = [
+    {"name": "hybridcnn", "path": './skin_cancerr.h5', "labels": classes, "version": "3"},
+    {"name": "sequential", "path": './skin_model.keras', "labels": classes, "version": "2"},
+    {"name": "dermanet", "path": './skin.keras', "labels": classes_without_normal, "version": "1"},
+]
+
+
+# Compressed copies that export.py writes next to a model file, e.g. skin_cancerr-int8.tflite
+VARIANTS = ("dynamic", "int8", "pruned")
+
+
+def variant_path(model_path, variant):
+    return f"{os.path.splitext(model_path)[0]}-{variant}.tflite"
+
+
+def register_variants(registry, name, path, labels, version):
+    """Register each exported variant of a model that exists on disk as "<name>-<variant>"."""
+    for variant in VARIANTS:
+        if os.path.exists(variant_path(path, variant)):
+            registry.register(f"{name}-{variant}", variant_path(path, variant), labels=labels,
+                              version=f"{version}-{variant}")
+
+
+def top_k(probabilities, labels, k=3):
+    """Return the k most likely (class name, probability) pairs from one row of model output."""
+    order = sorted(range(len(probabilities)), key=lambda i: probabilities[i], reverse=True)[:k]
+    return [(labels.get(i, str(i)), float(probabilities[i])) for i in order]
+
+
+def register_shipped_models(registry):
+    """Register every shipped model and its exported variants; each is loaded on its first prediction."""
+    for spec in SHIPPED_MODELS:
+        registry.register(spec["name"], spec["path"], labels=spec["labels"], version=spec["version"])
+        register_variants(registry, spec["name"], spec["path"], spec["labels"], spec["version"])
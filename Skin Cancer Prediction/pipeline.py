@@ -0,0 +1,123 @@
+"""Streaming tf.data input pipeline for training on an image store (see dataset.py).
+
+Minority classes are balanced by sampling each class stream with a weight
+instead of duplicating images, and augmentation runs on whole batches inside
+the graph. Only row numbers are shuffled; pixels are read from the
+memory-mapped store batch by batch, so memory use doesn't grow with the
+imbalance ratio.
+"""
+import math
+
+import numpy as np
+import tensorflow as tf
+
+# The notebook's ImageDataGenerator settings; shear_range is in degrees there too
+ROTATION_DEGREES = 20.0
+WIDTH_SHIFT = 0.2
+HEIGHT_SHIFT = 0.2
+SHEAR_DEGREES = 0.2
+ZOOM = 0.2
+
+
+def random_affine(images, seed):
+    """Randomly rotate, shift, shear, zoom and horizontally flip a float (B, H, W, C) batch.
+
+    One projective transform per image, applied to the whole batch in a single
+    op, with bilinear sampling and fill_mode='nearest' like ImageDataGenerator.
+    seed is a shape [2] tensor, so the same seed gives the same augmentation.
+    """
+    batch = tf.shape(images)[0]
+    height = tf.cast(tf.shape(images)[1], tf.float32)
+    width = tf.cast(tf.shape(images)[2], tf.float32)
+    u = tf.random.stateless_uniform([batch, 7], seed=seed, minval=-1.0, maxval=1.0)
+
+    theta = np.deg2rad(ROTATION_DEGREES) * u[:, 0]
+    shear = np.deg2rad(SHEAR_DEGREES) * u[:, 1]
+    tx = WIDTH_SHIFT * width * u[:, 2]
+    ty = HEIGHT_SHIFT * height * u[:, 3]
+    zx = 1.0 + ZOOM * u[:, 4]
+    zy = 1.0 + ZOOM * u[:, 5]
+    flip = tf.where(u[:, 6] > 0, -1.0, 1.0)
+
+    # Output-to-input mapping (rotation @ shear @ zoom @ flip) about the image centre, plus the shift
+    a0 = tf.cos(theta) * zx * flip
+    a1 = -tf.sin(theta + shear) * zy
+    b0 = tf.sin(theta) * zx * flip
+    b1 = tf.cos(theta + shear) * zy
+    cx = (width - 1.0) / 2.0
+    cy = (height - 1.0) / 2.0
+    a2 = cx - a0 * cx - a1 * cy + tx
+    b2 = cy - b0 * cx - b1 * cy + ty
+    zeros = tf.zeros_like(a0)
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms, output_shape=tf.shape(images)[1:3], fill_value=0.0,
+        interpolation="BILINEAR", fill_mode="NEAREST")
+
+
+def _gather_fn(images, labels):
+    """A tf.data map that reads a batch of rows from the (memory-mapped) arrays."""
+    image_shape = images.shape[1:]
+
+    def gather(rows):
+        return images[rows], labels[rows].astype(np.int64)
+
+    def read(rows):
+        x, y = tf.numpy_function(gather, [rows], [tf.uint8, tf.int64])
+        x.set_shape((None,) + tuple(image_shape))
+        y.set_shape((None,))
+        return x, y
+
+    return read
+
+
+def balanced_rows(labels, rows, seed, class_weights=None):
+    """An endless dataset of row numbers drawing each class with the given weight (equal by default)."""
+    classes = np.unique(labels[rows])
+    streams = []
+    for i, label in enumerate(classes):
+        class_rows = rows[labels[rows] == label]
+        streams.append(tf.data.Dataset.from_tensor_slices(class_rows)
+                       .shuffle(len(class_rows), seed=seed + i, reshuffle_each_iteration=True)
+                       .repeat())
+    weights = [float((class_weights or {}).get(int(label), 1.0)) for label in classes]
+    total = sum(weights)
+    return tf.data.Dataset.sample_from_datasets(streams, weights=[w / total for w in weights], seed=seed)
+
+
+def training_dataset(images, labels, rows, batch_size=32, seed=42, balanced=True, class_weights=None, augment=True):
+    """Endless, shuffled, optionally class-balanced and augmented batches of (float32 images, labels)."""
+    labels = np.asarray(labels)
+    rows = np.asarray(rows, dtype=np.int64)
+    if balanced:
+        ds = balanced_rows(labels, rows, seed, class_weights)
+    else:
+        ds = tf.data.Dataset.from_tensor_slices(rows).shuffle(len(rows), seed=seed).repeat()
+    ds = ds.batch(batch_size, drop_remainder=True)
+    ds = ds.map(_gather_fn(images, labels), num_parallel_calls=tf.data.AUTOTUNE)
+
+    def prepare(step, batch):
+        x, y = batch
+        x = tf.cast(x, tf.float32) * (1.0 / 255.0)
+        if augment:
+            # Seeded by the step number, so a run is reproducible even with parallel map
+            x = random_affine(x, tf.stack([tf.constant(seed, tf.int64), step]))
+        return x, y
+
+    ds = ds.enumerate().map(prepare, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def evaluation_dataset(images, labels, rows, batch_size=256):
+    """One ordered pass over the given rows, scaled to [0, 1] without augmentation."""
+    rows = np.asarray(rows, dtype=np.int64)
+    ds = tf.data.Dataset.from_tensor_slices(rows).batch(batch_size)
+    ds = ds.map(_gather_fn(images, np.asarray(labels)), num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) * (1.0 / 255.0), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def steps_per_epoch(rows, batch_size):
+    """Batches in one pass over the training rows, the epoch length used with the endless training stream."""
+    return max(1, math.ceil(len(rows) / batch_size))
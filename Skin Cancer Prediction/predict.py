@@ -1,24 +1,23 @@
 import os
+import threading
 import numpy as np
-from keras.models import load_model
 from PIL import Image
 from dotenv import load_dotenv
 import textwrap
-import google.generativeai as genai
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, EmailField
 from wtforms.validators import DataRequired, Length
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import login_user, LoginManager, login_required, current_user, logout_user
+from registry import registry, lazy_import, timings
+from preprocessing import preprocess_image
 
 # Load environment variables from .env
 
 load_dotenv()
 
-# Configure Google Generative AI with API Key
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 db = SQLAlchemy()
 # Initialize the Flask application
 app = Flask(__name__)
@@ -31,9 +30,9 @@ login_manager.login_view = "login"
 login_manager.init_app(app)
 
 
-# Load the pre-trained model
+# Register the pre-trained model; it is loaded on the first prediction, or by start_services()
 model_path = './skin.keras'  # Adjust the path to your model
-DermaNet = load_model(model_path)
+registry.register("dermanet", model_path)
 
 # Define class labels
 classes = {
@@ -64,8 +63,32 @@ class Register(db.Model):
         return True
 
 
-with app.app_context():
-    db.create_all()
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_services():
+    """Create the users table and optionally load the model, once per serving process.
+
+    Not done at import time: a preloading gunicorn master imports this module
+    and must not touch the database or load TensorFlow before it forks; its
+    post_fork hook calls this in each worker instead.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        with app.app_context():
+            db.create_all()
+        if os.getenv("PRELOAD_MODELS") == "1":
+            registry.preload()
+        _services_started = True
+
+
+@app.before_request
+def ensure_services():
+    if not _services_started:
+        start_services()
 
 
 class RegistrationForm(FlaskForm):
@@ -155,15 +178,6 @@ def join():
 
     return render_template("join.html")
 
-# Image preprocessing function
-def preprocess_image(image):
-    if image.mode == 'RGBA':
-        image = image.convert('RGB')
-    image = image.resize((28, 28))  # Adjust size as per your model
-    image_array = np.array(image) / 255.0  # Normalize
-    image_array = np.expand_dims(image_array, axis=0)  # Add batch dimension
-    return image_array
-
 @app.route('/')
 def homepage():
     return render_template('index.html')
@@ -197,7 +211,7 @@ def upload_image():
         img_array = preprocess_image(img)
 
         # Make prediction
-        prediction = DermaNet.predict(img_array)
+        prediction = registry.engine("dermanet").predict(img_array)
         pred_label = np.argmax(prediction, axis=1)[0]
         pred_class = classes[pred_label]
 
@@ -208,8 +222,15 @@ def upload_image():
 
 
 
+def get_genai():
+    """Import and configure Google Generative AI on first use."""
+    genai = lazy_import("google.generativeai")
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai
+
+
 def get_gemini_response(question):
-    model = genai.GenerativeModel('gemini-pro')
+    model = get_genai().GenerativeModel('gemini-pro')
     response = model.generate_content(question)
     return response.text
 
@@ -225,6 +246,12 @@ def chat():
 
 
 
+@app.route("/metrics/startup")
+def startup_metrics():
+    return jsonify({name: round(seconds, 4) for name, seconds in timings.items()})
+
+
 # Run the app
 if __name__ == '__main__':
+    start_services()
     app.run(debug=True)
\ No newline at end of file
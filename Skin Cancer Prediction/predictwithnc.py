@@ -1,18 +1,20 @@
 import os
+import threading
 import numpy as np
-from keras.models import load_model
 from PIL import Image
-import sqlite3
 from dotenv import load_dotenv
 import textwrap
-import google.generativeai as genai
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, EmailField
 from wtforms.validators import DataRequired, Length
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import login_user, LoginManager, login_required, current_user, logout_user
+from batching import MicroBatcher
+from registry import registry, lazy_import, timings
+from database import Database
+from preprocessing import preprocess_image
 from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
@@ -23,14 +25,15 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 load_dotenv()
-DB_PATH = r"C:\Users\TUFF\Desktop\Study\skin cancer\instance\video-meeting.db"
-# Configure Google Generative AI with API Key
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 db = SQLAlchemy()
 # Initialize the Flask application
 app = Flask(__name__)
 app.config['SECRET_KEY'] = "my-secrets"
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///video-meeting.db"
+# One database file for both the SQLAlchemy users table and the bookings queries, as in test.py
+DB_PATH = os.path.abspath(os.getenv("DATABASE_PATH", os.path.join(app.instance_path, "video-meeting.db")))
+os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_PATH}?check_same_thread=False"
+database = Database(DB_PATH)
 db.init_app(app)
 
 login_manager = LoginManager()
@@ -39,8 +42,15 @@ login_manager.init_app(app)
 today = datetime.today().date()
 
 
-# Load the pre-trained model
-HybridCNN = load_model('./skin_cancerr.h5')
+# Register the pre-trained model; it is loaded on the first prediction, or by start_services()
+registry.register("hybridcnn", './skin_cancerr.h5')
+
+# Collect concurrent uploads into a single forward pass
+batcher = MicroBatcher(
+    lambda batch: registry.engine("hybridcnn").predict(batch),
+    max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "16")),
+    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", "5")),
+)
 
 # Define class labels
 classes = {
@@ -56,9 +66,6 @@ classes = {
 
 def create_database():
     """Create the database and bookings table if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
     # Create the bookings table if it doesn't exist
     query = '''CREATE TABLE IF NOT EXISTS bookings (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,55 +75,38 @@ def create_database():
                     date TEXT NOT NULL,
                     message TEXT
                 )'''
-    
-    cursor.execute(query)
-    conn.commit()
-    conn.close()
+
+    database.execute(query)
 
 
 def save_booking(name, email, phone, date, message):
     """Insert booking data into the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Check the number of bookings for the selected date
-    query_check = "SELECT COUNT(*) FROM bookings WHERE date = ?"
-    cursor.execute(query_check, (date,))
-    booking_count = cursor.fetchone()[0]
-
-    # Allow only 15 bookings per day
-    if booking_count >= 15:
-        flash("Sorry, the maximum number of bookings for this day has been reached. Please select another date.", "error")
-        conn.close()
-        return False
-
-    # SQL query to insert booking data into the bookings table
-    query_insert = '''INSERT INTO bookings (name, email, phone, date, message)
-                      VALUES (?, ?, ?, ?, ?)'''
-    
-    cursor.execute(query_insert, (name, email, phone, date, message))
-    conn.commit()
-    conn.close()
+    # IMMEDIATE takes the write lock before the count, so two requests can't both take the last slot
+    with database.transaction("IMMEDIATE") as conn:
+        # Check the number of bookings for the selected date
+        query_check = "SELECT COUNT(*) FROM bookings WHERE date = ?"
+        booking_count = conn.execute(query_check, (date,)).fetchone()[0]
 
-    return True
+        # Allow only 15 bookings per day
+        if booking_count >= 15:
+            flash("Sorry, the maximum number of bookings for this day has been reached. Please select another date.", "error")
+            return False
 
-# Call the function to create the database and table if it doesn't exist
-create_database()
+        # SQL query to insert booking data into the bookings table
+        query_insert = '''INSERT INTO bookings (name, email, phone, date, message)
+                          VALUES (?, ?, ?, ?, ?)'''
+
+        conn.execute(query_insert, (name, email, phone, date, message))
+
+    return True
 
 
 def email_exists(email):
     """Check if the email exists in the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Query to check if the email exists in the users table (update with your actual table name)
+    # Query to check if the email exists in the users table created by SQLAlchemy
     query = "SELECT 1 FROM register WHERE email = ? LIMIT 1"
-    cursor.execute(query, (email,))
-    result = cursor.fetchone()
-
-    conn.close()
-
-    return result is not None 
+    result = database.fetchone(query, (email,))
+    return result is not None
 
 class Register(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -136,8 +126,33 @@ class Register(db.Model):
         return True
 
 
-with app.app_context():
-    db.create_all()
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_services():
+    """Create the tables and optionally load the model, once per serving process.
+
+    Not done at import time: a preloading gunicorn master imports this module
+    and must not touch the database or load TensorFlow before it forks; its
+    post_fork hook calls this in each worker instead.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        create_database()
+        with app.app_context():
+            db.create_all()
+        if os.getenv("PRELOAD_MODELS") == "1":
+            registry.preload()
+        _services_started = True
+
+
+@app.before_request
+def ensure_services():
+    if not _services_started:
+        start_services()
 
 
 class RegistrationForm(FlaskForm):
@@ -228,22 +243,6 @@ def join():
 
     return render_template("join.html")
 
-def preprocess_image(image, target_size=(28, 28)):
-    # Convert RGBA images to RGB by removing the alpha channel
-    if image.mode == 'RGBA':
-        image = image.convert('RGB')
-    # Convert grayscale images (L mode) to RGB by repeating the grayscale values across 3 channels
-    elif image.mode == 'L':  # 'L' mode is for grayscale images
-        image = image.convert('RGB')
-        
-    image = image.resize(target_size)  # Resize to the target size expected by the model
-    image_array = np.array(image) / 255.0  # Normalize pixel values
-    if image_array.shape[-1] != 3:  # Ensure the image has 3 color channels (RGB)
-        raise ValueError("Input image must have 3 color channels (RGB).")
-    
-    image_array = np.expand_dims(image_array, axis=0)  # Add batch dimension
-    return image_array
-
 
 
 @app.route('/', methods=['POST', 'GET'])
@@ -329,8 +328,8 @@ def upload_image():
         except ValueError as e:
             return str(e), 400  # If the image is not in RGB format, return an error
 
-        # Make prediction using the HybridCNN model
-        prediction = HybridCNN.predict(img_array)  # Model is correctly loaded here
+        # Make prediction using the HybridCNN model (loaded on first use)
+        prediction = batcher.predict(img_array)
         pred_label = np.argmax(prediction, axis=1)[0]
         pred_class = classes[pred_label]
 
@@ -339,8 +338,15 @@ def upload_image():
 
     return render_template('upload.html')
 
+def get_genai():
+    """Import and configure Google Generative AI on first use."""
+    genai = lazy_import("google.generativeai")
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai
+
+
 def get_gemini_response(question):
-    model = genai.GenerativeModel('gemini-pro')
+    model = get_genai().GenerativeModel('gemini-pro')
     response = model.generate_content(question)
     return response.text
 
@@ -354,6 +360,12 @@ def chat():
     return render_template("chat.html", response=response)
 
 
+@app.route("/metrics/startup")
+def startup_metrics():
+    return jsonify({name: round(seconds, 4) for name, seconds in timings.items()})
+
+
 # Run the app
 if __name__ == '__main__':
+    start_services()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,61 @@
+import numpy as np
+
+# Input size expected by all the shipped models
+TARGET_SIZE = (28, 28)
+CHANNELS = 3
+
+# What preprocess_batch() does, recorded in model bundles so a model is only served with matching input
+PREPROCESSING_SPEC = {
+    "target_size": list(TARGET_SIZE),
+    "channels": CHANNELS,
+    "color_mode": "RGB",
+    "dtype": "float32",
+    "scale": 1.0 / 255.0,
+}
+
+
+def to_rgb(image, target_size=TARGET_SIZE, draft=True):
+    """Decode, convert to RGB and resize one PIL image to the model input size.
+
+    With draft=True, JPEGs are decoded at a reduced scale (1/2 to 1/8) that is
+    still larger than the target, which makes large phone photos much cheaper
+    to decode before the final resize.
+    """
+    if draft and image.format == 'JPEG':
+        image.draft('RGB', (target_size[0] * 4, target_size[1] * 4))
+    if image.mode != 'RGB':
+        # Covers RGBA (drops the alpha channel), L (grayscale repeated across channels), P, CMYK, ...
+        image = image.convert('RGB')
+    return image.resize(target_size)
+
+
+def preprocess_batch(images, target_size=TARGET_SIZE, out=None, draft=True):
+    """Turn N PIL images into a contiguous float32 (N, height, width, 3) array scaled to [0, 1].
+
+    Images may also be uint8 arrays already decoded to the target size, e.g. by
+    worker threads or processes. The output buffer is allocated once (or passed
+    in via out, which may have more rows than images) and filled in place; only
+    the first N rows are scaled and returned.
+    """
+    images = list(images)
+    if out is None:
+        out = np.empty((len(images), target_size[1], target_size[0], CHANNELS), dtype=np.float32)
+    batch = out[:len(images)]
+    for i, image in enumerate(images):
+        batch[i] = image if isinstance(image, np.ndarray) else np.asarray(to_rgb(image, target_size, draft=draft),
+                                                                          dtype=np.uint8)
+    batch *= np.float32(1.0 / 255.0)
+    return batch
+
+
+def preprocess_image(image, target_size=TARGET_SIZE, draft=True):
+    """Single-image version of preprocess_batch(), returning a (1, height, width, 3) array."""
+    return preprocess_batch([image], target_size, draft=draft)
+
+
+def pixels_to_batch(pixels, target_size=TARGET_SIZE):
+    """Turn flattened pixel rows (the hmnist/merged CSV layout) into a float32 (N, height, width, 3) array."""
+    pixels = np.asarray(pixels)
+    out = np.empty((pixels.shape[0], target_size[1], target_size[0], CHANNELS), dtype=np.float32)
+    np.multiply(pixels.reshape(out.shape), np.float32(1.0 / 255.0), out=out, casting='unsafe')
+    return out
@@ -0,0 +1,206 @@
+import importlib
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from batching import MicroBatcher
+
+# Seconds spent importing heavy modules and loading models, keyed like "import:tensorflow" or "load:hybridcnn"
+timings = {}
+
+
+def lazy_import(module_name):
+    """Import a module on first use and record how long the import took."""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    timings[f"import:{module_name}"] = time.perf_counter() - start
+    return module
+
+
+class ModelRegistry:
+    """Keep track of model artifacts and load each one the first time it is needed."""
+
+    def __init__(self):
+        self._specs = {}
+        self._models = {}
+        self._engines = {}
+        self._batchers = {}
+        self._lock = threading.Lock()
+        self.shadow = None
+
+    def register(self, name, path, labels=None, version="1"):
+        """Record where a model lives, its label map and version, without loading it."""
+        self._specs[name] = {"path": path, "labels": labels or {}, "version": str(version)}
+
+    def names(self):
+        return list(self._specs)
+
+    def resolve(self, key=None):
+        """Map a request's model selector ("name" or "name:version") to a registered name."""
+        if not key:
+            key = os.getenv("DEFAULT_MODEL") or self.names()[0]
+        name, _, version = key.partition(":")
+        if name not in self._specs:
+            raise KeyError(f"Unknown model '{name}'")
+        if version and self._specs[name]["version"] != version:
+            raise KeyError(f"Model '{name}' has no version '{version}'")
+        return name
+
+    def labels(self, name):
+        return self._specs[name]["labels"]
+
+    def version(self, name):
+        return self._specs[name]["version"]
+
+    def path(self, name):
+        return self._specs[name]["path"]
+
+    def is_loaded(self, name):
+        return name in self._models or name in self._engines
+
+    def is_tflite(self, name):
+        # Compressed variants written by export.py; they have no Keras model and always run on TFLite
+        return self._specs[name]["path"].endswith('.tflite')
+
+    def model(self, name):
+        """Return the Keras model, loading it on first use."""
+        if name in self._models:
+            return self._models[name]
+        with self._lock:
+            if name not in self._models:
+                path = self._specs[name]["path"]
+                lazy_import("tensorflow")
+                load_model = lazy_import("keras.models").load_model
+                start = time.perf_counter()
+                self._models[name] = load_model(path)
+                timings[f"load:{name}"] = time.perf_counter() - start
+                print(f"Loaded model '{name}' from {path} in {timings[f'load:{name}']:.2f}s")
+        return self._models[name]
+
+    def engine(self, name):
+        """Return the inference engine for a model, building it on first use."""
+        if name in self._engines:
+            return self._engines[name]
+        if self.is_tflite(name):
+            with self._lock:
+                if name not in self._engines:
+                    TFLiteEngine = lazy_import("inference").TFLiteEngine
+                    start = time.perf_counter()
+                    self._engines[name] = TFLiteEngine(model_path=self._specs[name]["path"])
+                    timings[f"engine:{name}"] = time.perf_counter() - start
+            return self._engines[name]
+        model = self.model(name)
+        with self._lock:
+            if name not in self._engines:
+                create_engine = lazy_import("inference").create_engine
+                start = time.perf_counter()
+                self._engines[name] = create_engine(model, os.getenv("INFERENCE_BACKEND", "function"))
+                timings[f"engine:{name}"] = time.perf_counter() - start
+        return self._engines[name]
+
+    def batcher(self, name):
+        """Return the micro-batcher in front of a model's engine."""
+        with self._lock:
+            if name not in self._batchers:
+                self._batchers[name] = MicroBatcher(
+                    lambda batch: self.engine(name).predict(batch),
+                    max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "16")),
+                    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", "5")),
+                )
+        return self._batchers[name]
+
+    def preload(self, names=None):
+        """Load models up front, so the first request doesn't pay for it.
+
+        Call this in the process that serves requests (e.g. a gunicorn worker after
+        the fork), never in a process that forks afterwards: TensorFlow isn't
+        fork-safe. Engines are still built lazily on first use.
+        """
+        for name in names or self.names():
+            # TFLite interpreters are per-process state, so they are left to the workers
+            if not self.is_tflite(name):
+                self.model(name)
+
+    def memory(self):
+        """Report artifact size and, for loaded models, the bytes held by their weights."""
+        report = {}
+        for name, spec in self._specs.items():
+            entry = {
+                "version": spec["version"],
+                "loaded": self.is_loaded(name),
+                "file_bytes": os.path.getsize(spec["path"]) if os.path.exists(spec["path"]) else None,
+                "weight_bytes": None,
+            }
+            if name in self._models:
+                entry["weight_bytes"] = int(sum(w.nbytes for w in self._models[name].get_weights()))
+            report[name] = entry
+        return report
+
+    def set_shadow(self, candidate, fraction):
+        """Evaluate a candidate model in the background on a sampled fraction of traffic."""
+        self.shadow = ShadowEvaluator(self, self.resolve(candidate), fraction)
+
+
+class ShadowEvaluator:
+    """Run a candidate model off the request path and count how often it agrees with the primary."""
+
+    def __init__(self, registry, candidate, fraction, max_pending=32):
+        self.registry = registry
+        self.candidate = candidate
+        self.fraction = fraction
+        self.max_pending = max_pending
+        self.stats = {"sampled": 0, "dropped": 0, "agreed": 0, "errors": 0, "seconds": 0.0}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def maybe_submit(self, img_array, primary_class):
+        """Queue a shadow prediction for a sampled request; never blocks the caller."""
+        if self.fraction <= 0 or random.random() >= self.fraction:
+            return
+        with self._lock:
+            # Shed shadow work rather than let it pile up behind a slow candidate
+            if self._pending >= self.max_pending:
+                self.stats["dropped"] += 1
+                return
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(self._evaluate, img_array, primary_class)
+
+    def _evaluate(self, img_array, primary_class):
+        start = time.perf_counter()
+        try:
+            prediction = self.registry.batcher(self.candidate).predict(img_array)
+            candidate_class = self.registry.labels(self.candidate).get(int(np.argmax(prediction, axis=1)[0]))
+            agreed = candidate_class == primary_class
+            error = False
+        except Exception as e:
+            print(f"Shadow prediction with '{self.candidate}' failed: {e}")
+            agreed = False
+            error = True
+        with self._lock:
+            self._pending -= 1
+            self.stats["sampled"] += 1
+            self.stats["agreed"] += int(agreed)
+            self.stats["errors"] += int(error)
+            self.stats["seconds"] += time.perf_counter() - start
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        sampled = stats["sampled"] - stats["errors"]
+        stats["candidate"] = self.candidate
+        stats["fraction"] = self.fraction
+        stats["agreement"] = stats["agreed"] / sampled if sampled else None
+        return stats
+
+
+registry = ModelRegistry()
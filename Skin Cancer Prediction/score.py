@@ -0,0 +1,174 @@
+"""Score a directory of images or a pixel CSV with one of the shipped models, without the Flask app.
+
+    python score.py images/ --model hybridcnn --out predictions.csv
+    python score.py hmnist_28_28_RGB.csv --model dermanet --out predictions.parquet
+    python score.py merged_RGB.dataset --model hybridcnn --out predictions.parquet
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch import chunks, decode_image
+from dataset import is_dataset, open_dataset
+from ingest import list_images
+from models import SHIPPED_MODELS
+from preprocessing import pixels_to_batch, preprocess_batch
+
+
+def decode_path(path):
+    """Runs in a worker process: decode one image file with the same code as /upload/batch, or None if unreadable."""
+    try:
+        return decode_image(path)
+    except (ValueError, OSError):
+        return None
+
+
+class Timer:
+    """Accumulate time spent in the decode and inference stages."""
+
+    def __init__(self):
+        self.seconds = {"decode": 0.0, "inference": 0.0, "write": 0.0}
+
+    def add(self, stage, start):
+        self.seconds[stage] += time.perf_counter() - start
+
+
+def iter_directory(root, pool, workers, chunk_size, timer):
+    """Yield (ids, float32 batch, true labels) chunks for every image under root."""
+    for paths in chunks(list_images(root), chunk_size):
+        start = time.perf_counter()
+        decoded = pool.map(decode_path, paths, chunksize=max(1, chunk_size // (4 * workers)))
+        ok = [(path, pixels) for path, pixels in zip(paths, decoded) if pixels is not None]
+        for path, pixels in zip(paths, decoded):
+            if pixels is None:
+                print(f"Skipping unreadable image {path}")
+        batch = preprocess_batch([pixels for _, pixels in ok])
+        timer.add("decode", start)
+        yield [path for path, _ in ok], batch, None
+
+
+def iter_pixel_csv(path, chunk_size, timer):
+    """Yield (ids, float32 batch, true labels) chunks from an hmnist-style pixel CSV."""
+    offset = 0
+    start = time.perf_counter()
+    for frame in pd.read_csv(path, chunksize=chunk_size):
+        y_true = frame.pop('label').to_numpy() if 'label' in frame.columns else None
+        batch = pixels_to_batch(frame.to_numpy(dtype=np.uint8))
+        ids = list(range(offset, offset + len(frame)))
+        offset += len(frame)
+        timer.add("decode", start)
+        yield ids, batch, y_true
+        start = time.perf_counter()
+
+
+def iter_dataset(path, chunk_size, timer):
+    """Yield (ids, float32 batch, true labels) chunks from a memory-mapped image store (see dataset.py)."""
+    data = open_dataset(path)
+    for offset in range(0, len(data), chunk_size):
+        start = time.perf_counter()
+        batch = pixels_to_batch(data.images[offset:offset + chunk_size])
+        y_true = np.asarray(data.labels[offset:offset + chunk_size])
+        timer.add("decode", start)
+        yield list(range(offset, offset + len(batch))), batch, y_true
+
+
+class PredictionWriter:
+    """Append prediction chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score images or pixel CSVs offline with a shipped model.")
+    parser.add_argument("source", help="Directory of images, an image store or a pixel CSV (hmnist_28_28_RGB.csv layout)")
+    parser.add_argument("--model", default=SHIPPED_MODELS[0]["name"], choices=[m["name"] for m in SHIPPED_MODELS])
+    parser.add_argument("--out", default="predictions.csv", help="Output .csv or .parquet file")
+    parser.add_argument("--backend", default="function", help="Inference backend: keras, function or tflite")
+    parser.add_argument("--batch-size", type=int, default=512, help="Images per forward pass")
+    parser.add_argument("--chunk-size", type=int, default=4096, help="Images decoded and held in memory at a time")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Decode processes")
+    args = parser.parse_args()
+
+    from keras.models import load_model
+    from inference import create_engine
+
+    spec = next(m for m in SHIPPED_MODELS if m["name"] == args.model)
+    labels = spec["labels"]
+    engine = create_engine(load_model(spec["path"]), args.backend)
+
+    timer = Timer()
+    writer = PredictionWriter(args.out)
+    total = correct = labelled = 0
+    pool = None
+    start = time.perf_counter()
+    try:
+        if is_dataset(args.source):
+            chunks = iter_dataset(args.source, args.chunk_size, timer)
+        elif os.path.isdir(args.source):
+            pool = multiprocessing.Pool(args.workers)
+            chunks = iter_directory(args.source, pool, args.workers, args.chunk_size, timer)
+        else:
+            chunks = iter_pixel_csv(args.source, args.chunk_size, timer)
+
+        for ids, batch, y_true in chunks:
+            if len(batch) == 0:
+                continue
+            t = time.perf_counter()
+            probabilities = np.concatenate([engine.predict(batch[i:i + args.batch_size])
+                                            for i in range(0, len(batch), args.batch_size)])
+            timer.add("inference", t)
+
+            t = time.perf_counter()
+            predicted = np.argmax(probabilities, axis=1)
+            frame = pd.DataFrame(probabilities, columns=[labels.get(i, str(i)) for i in range(probabilities.shape[1])])
+            frame.insert(0, "id", ids)
+            frame.insert(1, "label", predicted)
+            frame.insert(2, "class_name", [labels.get(int(p)) for p in predicted])
+            if y_true is not None:
+                frame.insert(3, "true_label", y_true)
+                correct += int(np.sum(predicted == y_true))
+                labelled += len(y_true)
+            writer.write(frame)
+            timer.add("write", t)
+            total += len(batch)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    wall = time.perf_counter() - start
+    print(f"Scored {total} images with '{args.model}' in {wall:.2f}s ({total / wall if wall else 0:.1f} images/s)")
+    for stage, seconds in timer.seconds.items():
+        print(f"  {stage:>9}: {seconds:8.2f}s ({seconds / wall * 100 if wall else 0:5.1f}%)")
+    if labelled:
+        print(f"  accuracy against the 'label' column: {correct / labelled:.4f}")
+    print(f"Predictions written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,62 +1,117 @@
 import os
+import threading
 import numpy as np
-from keras.models import load_model
 from PIL import Image
-import sqlite3
 from dotenv import load_dotenv
 import textwrap
-import google.generativeai as genai
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Request, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, session
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, EmailField
 from wtforms.validators import DataRequired, Length
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from flask_login import login_user, LoginManager, login_required, current_user, logout_user
-from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from registry import registry, timings
+from models import register_shipped_models, top_k
+from bundles import register_bundles
+from calibration import apply_temperature, load_calibration, temperature_for
+from tta import MAX_VIEWS, predict_tta
+from preprocessing import preprocess_image
+from cache import PredictionCache
+from uploads import SpooledUpload, take_upload, UploadTooLarge, UploadWriter
+from jobs import JobQueue
+from batch import iter_uploaded_images, score_images, to_ndjson, to_csv
+from database import Database, configure_connection
+from mailer import MailDispatcher
+from bookings import create_indexes, page_bookings, page_size, iter_bookings_csv, DistinctEmailCache, SORT_COLUMNS
+from chat import ChatService, ResponseCache, create_backend, sse, class_snippets, build_context, build_prompt, cache_key
+from faq import load_faq
+from datetime import datetime, timedelta
 # Load environment variables from .env
 
 load_dotenv()
-DB_PATH = r"C:\Users\HP\OneDrive\Desktop\Major Project Updated\instance\video-meeting.db"
-# Configure Google Generative AI with API Key
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 db = SQLAlchemy()
+
+
+class UploadLimitRequest(Request):
+    """Request that spools uploads as they are parsed, with a larger body limit on /upload/batch than elsewhere."""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'upload_batch':
+            return app.config['BATCH_MAX_CONTENT_LENGTH']
+        return app.config['MAX_CONTENT_LENGTH']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Uploads are hashed and spooled while the body is parsed, and the views take them over without a copy
+        return SpooledUpload()
+
+
 # Initialize the Flask application
 app = Flask(__name__)
+app.request_class = UploadLimitRequest
 app.config['SECRET_KEY'] = "my-secrets"
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///video-meeting.db?check_same_thread=False"
+
+# One database file for both the SQLAlchemy users table and the bookings data layer
+# Absolute, so Flask-SQLAlchemy doesn't resolve a relative path against instance_path while Database uses the cwd
+DB_PATH = os.path.abspath(os.getenv("DATABASE_PATH", os.path.join(app.instance_path, "video-meeting.db")))
+os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_PATH}?check_same_thread=False"
+database = Database(DB_PATH)
+# Reject oversized request bodies while they are still being received
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_MB", "16")) * 1024 * 1024
+# Batch uploads are whole ZIP archives, scored one chunk at a time, so they get their own limit
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.getenv("BATCH_UPLOAD_MAX_MB", "1024")) * 1024 * 1024
 
 db.init_app(app)
 
+# Give SQLAlchemy's connections the same WAL/busy_timeout settings as the data layer
+with app.app_context():
+    event.listen(db.engine, "connect", lambda dbapi_conn, record: configure_connection(dbapi_conn))
+
 login_manager = LoginManager()
 login_manager.login_view = "login"
 login_manager.init_app(app)
 today = datetime.today().date()
 
 
-# Load the pre-trained model
-HybridCNN = load_model('./skin_cancerr.h5')
+# Register the pre-trained models (see models.py); each is loaded on its first prediction
+register_shipped_models(registry)
+# Models trained with train.py; a bundle with the same name as a shipped model replaces it
+register_bundles(registry, os.getenv("MODEL_BUNDLES_DIR", "artifacts"))
+
+# Optionally run a candidate model in the background on a fraction of uploads
+if os.getenv("SHADOW_MODEL"):
+    registry.set_shadow(os.getenv("SHADOW_MODEL"), float(os.getenv("SHADOW_FRACTION", "0.1")))
+
+# Re-uploads of the same photo skip decoding and inference
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", "3600")),
+    disk_path=os.getenv("PREDICTION_CACHE_PATH"),
+    disk_max_entries=int(os.getenv("PREDICTION_CACHE_DISK_SIZE", "100000")),
+)
+
+# Per-model softmax temperatures fitted offline by calibration.py
+calibration = load_calibration(os.getenv("CALIBRATION_PATH", "calibration.json"))
+
+# Test-time augmentation views per prediction unless the request passes ?tta=K; 1 means a single view
+TTA_DEFAULT_VIEWS = int(os.getenv("TTA_VIEWS", "1"))
+
+# Writes uploaded images to static/uploads after the response is computed
+upload_writer = UploadWriter()
+
+# Process pool for /upload?async=1; job state lives in SQLite so any web worker can report it
+job_queue = JobQueue(os.getenv("JOBS_DB_PATH", "jobs.db"), workers=int(os.getenv("ASYNC_WORKERS", "2")),
+                     ttl_seconds=float(os.getenv("JOBS_TTL_SECONDS", "86400")))
+
+# Allow only 15 bookings per day
+MAX_BOOKINGS_PER_DAY = 15
 
-# Define class labels
-classes = {
-    4: 'Nevus',
-    6: 'Melanoma',
-    2: 'Seborrheic Keratosis',
-    1: 'Basal Cell Carcinoma',
-    5: 'Vascular Lesion',
-    0: 'Actinic Keratosis',
-    3: 'Dermatofibroma',
-    7:'Normal Class'
-}
 
 def create_database():
     """Create the database and bookings table if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
     # Create the bookings table if it doesn't exist
     query = '''CREATE TABLE IF NOT EXISTS bookings (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -66,53 +121,68 @@ def create_database():
                     date TEXT NOT NULL,
                     message TEXT
                 )'''
-    
-    cursor.execute(query)
-    conn.commit()
-    conn.close()
+
+    database.execute(query)
+
+    # One counter row per date, so the capacity check doesn't have to count bookings
+    with database.transaction("IMMEDIATE") as conn:
+        create_indexes(conn)
+        conn.execute('''CREATE TABLE IF NOT EXISTS booking_capacity (
+                            date TEXT PRIMARY KEY,
+                            booked INTEGER NOT NULL DEFAULT 0
+                        )''')
+        # Backfill counters for bookings made before the table existed
+        conn.execute('''INSERT OR IGNORE INTO booking_capacity (date, booked)
+                        SELECT date, COUNT(*) FROM bookings GROUP BY date''')
 
 
 def save_booking(name, email, phone, date, message):
     """Insert booking data into the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Check the number of bookings for the selected date
-    query_check = "SELECT COUNT(*) FROM bookings WHERE date = ?"
-    cursor.execute(query_check, (date,))
-    booking_count = cursor.fetchone()[0]
-
-    # Allow only 15 bookings per day
-    if booking_count >= 15:
-        flash("Sorry, the maximum number of bookings for this day has been reached. Please select another date.", "error")
-        conn.close()
-        return False
+    # IMMEDIATE takes the write lock before the capacity check, so two requests can't both claim the last slot
+    with database.transaction("IMMEDIATE") as conn:
+        # Claim a slot for the selected date; the update is skipped once the day is full
+        query_claim = '''INSERT INTO booking_capacity (date, booked) VALUES (?, 1)
+                         ON CONFLICT(date) DO UPDATE SET booked = booked + 1 WHERE booked < ?'''
+        claimed = conn.execute(query_claim, (date, MAX_BOOKINGS_PER_DAY)).rowcount
 
-    # SQL query to insert booking data into the bookings table
-    query_insert = '''INSERT INTO bookings (name, email, phone, date, message)
-                      VALUES (?, ?, ?, ?, ?)'''
-    
-    cursor.execute(query_insert, (name, email, phone, date, message))
-    conn.commit()
-    conn.close()
+        if not claimed:
+            flash("Sorry, the maximum number of bookings for this day has been reached. Please select another date.", "error")
+            return False
+
+        # SQL query to insert booking data into the bookings table
+        query_insert = '''INSERT INTO bookings (name, email, phone, date, message)
+                          VALUES (?, ?, ?, ?, ?)'''
 
+        conn.execute(query_insert, (name, email, phone, date, message))
+
+    email_cache.invalidate()
     return True
 
-# Call the function to create the database and table if it doesn't exist
-create_database()
+
+def get_availability(start_date, end_date):
+    """Return {date: remaining slots} for every day from start_date to end_date inclusive."""
+    rows = database.fetchall("SELECT date, booked FROM booking_capacity WHERE date BETWEEN ? AND ?",
+                             (start_date.isoformat(), end_date.isoformat()))
+    booked = dict(rows)
+    availability = {}
+    day = start_date
+    while day <= end_date:
+        availability[day.isoformat()] = max(0, MAX_BOOKINGS_PER_DAY - booked.get(day.isoformat(), 0))
+        day += timedelta(days=1)
+    return availability
+
+# Distinct booking emails for the admin dashboard, refreshed after new bookings
+email_cache = DistinctEmailCache(database)
+
+# Outgoing mail is queued in the outbox table and sent by a background worker (SMTP_* settings)
+mailer = MailDispatcher.from_env(database)
 
 
 def email_exists(email):
     """Check if the email exists in the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Query to check if the email exists in the users table (update with your actual table name)
+    # Query to check if the email exists in the users table created by SQLAlchemy
     query = "SELECT 1 FROM register WHERE email = ? LIMIT 1"
-    cursor.execute(query, (email,))
-    result = cursor.fetchone()
-
-    conn.close()
+    result = database.fetchone(query, (email,))
 
     return result is not None 
 
@@ -134,8 +204,35 @@ class Register(db.Model):
         return True
 
 
-with app.app_context():
-    db.create_all()
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_services():
+    """Create the tables, start the mail workers and optionally load the models, once per serving process.
+
+    None of this happens at import time: the job queue's spawned workers re-import
+    this module (as __mp_main__ under `python test.py`), and a preloading gunicorn
+    master imports it too, and neither should touch the database, start threads
+    or load TensorFlow.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        create_database()
+        with app.app_context():
+            db.create_all()
+        mailer.start()
+        if os.getenv("PRELOAD_MODELS") == "1":
+            registry.preload()
+        _services_started = True
+
+
+@app.before_request
+def ensure_services():
+    if not _services_started:
+        start_services()
 
 
 class RegistrationForm(FlaskForm):
@@ -235,21 +332,12 @@ def dashboard():
 
 
 def send_email(recipient_email, subject, message):
-    sender_email = "chavansiddhesh105477@gmail.com"  # Replace with your Gmail address
-    password = "irld qqpj tmvx lsih"
-    msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = recipient_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(message, "plain"))
-
+    """Queue an email for the background dispatcher; delivery and retries happen off the request."""
     try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, recipient_email, msg.as_string())
+        mailer.enqueue(recipient_email, subject, message)
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
         return False
 
 
@@ -260,30 +348,92 @@ def admin_dashboard():
         flash("Unauthorized access!", "error")
         return redirect(url_for("homepage"))
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Fetch all bookings
-    cursor.execute("SELECT * FROM bookings")
-    bookings = cursor.fetchall()
+    # Fetch one page of bookings, filtered and sorted in SQL
+    filters, sort, descending = booking_filters()
+    try:
+        bookings, next_cursor = page_bookings(database, filters, sort, descending,
+                                              after=request.args.get("after"),
+                                              limit=page_size(request.args.get("limit")))
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(url_for("admin_dashboard"))
 
     # Fetch all unique email addresses
-    cursor.execute("SELECT DISTINCT email FROM bookings")
-    emails = [row[0] for row in cursor.fetchall()]
-
-    conn.close()
+    emails = email_cache.get()
 
     if request.method == "POST":
         recipient_email = request.form.get("recipient_email")
         subject = request.form.get("subject")
         message = request.form.get("message")
 
-        if send_email(recipient_email, subject, message):
-            flash("Email sent successfully!", "success")
+        if request.form.get("broadcast"):
+            # Broadcast to everyone with a booking, optionally only within a date range
+            start_date = request.form.get("start_date") or None
+            end_date = request.form.get("end_date") or None
+            recipients = booking_recipients(start_date, end_date)
+            if recipients:
+                description = f"Bookings from {start_date or 'the start'} to {end_date or 'now'}"
+                campaign_id = mailer.create_campaign(subject, message, recipients, description=description)
+                flash(f"Broadcast #{campaign_id} queued for {len(recipients)} recipients.", "success")
+            else:
+                flash("No bookings match the selected dates.", "error")
+        elif send_email(recipient_email, subject, message):
+            flash("Email queued for delivery!", "success")
         else:
             flash("Failed to send email.", "error")
 
-    return render_template("admin_dashboard.html", bookings=bookings, emails=emails)
+    return render_template("admin_dashboard.html", bookings=bookings, emails=emails,
+                           next_cursor=next_cursor, filters=filters, sort=sort, descending=descending,
+                           campaigns=mailer.campaigns(), mail_stats=mailer.stats())
+
+
+def booking_filters():
+    """Read the admin bookings filters and sort order from the query string."""
+    filters = {key: request.args.get(key) for key in ("email", "name", "start_date", "end_date")}
+    sort = request.args.get("sort", "date")
+    if sort not in SORT_COLUMNS:
+        sort = "date"
+    descending = request.args.get("order") == "desc"
+    return filters, sort, descending
+
+
+@app.route("/admin/bookings.csv")
+@login_required
+def export_bookings():
+    if current_user.username != "admin":
+        flash("Unauthorized access!", "error")
+        return redirect(url_for("homepage"))
+
+    # Streamed page by page, so the export never holds the whole result set
+    filters, sort, descending = booking_filters()
+    return Response(stream_with_context(iter_bookings_csv(database, filters, sort, descending)),
+                    mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=bookings.csv'})
+
+
+def booking_recipients(start_date=None, end_date=None):
+    """Distinct emails of everyone with a booking, optionally within a YYYY-MM-DD date range."""
+    query = "SELECT DISTINCT email FROM bookings WHERE 1 = 1"
+    params = []
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND date <= ?"
+        params.append(end_date)
+    return [row[0] for row in database.fetchall(query, params)]
+
+
+@app.route("/admin/campaigns/<int:campaign_id>")
+@login_required
+def campaign_progress(campaign_id):
+    # Polled by the dashboard to show live delivery progress
+    if current_user.username != "admin":
+        return jsonify({"error": "Unauthorized access!"}), 403
+
+    progress = mailer.campaign_progress(campaign_id)
+    if progress is None:
+        return jsonify({"error": "Unknown campaign"}), 404
+    return jsonify(progress)
 
 
 
@@ -313,23 +463,22 @@ def join():
 
     return render_template("join.html")
 
-def preprocess_image(image, target_size=(28, 28)):
-    # Convert RGBA images to RGB by removing the alpha channel
-    if image.mode == 'RGBA':
-        image = image.convert('RGB')
-    # Convert grayscale images (L mode) to RGB by repeating the grayscale values across 3 channels
-    elif image.mode == 'L':  # 'L' mode is for grayscale images
-        image = image.convert('RGB')
-        
-    image = image.resize(target_size)  # Resize to the target size expected by the model
-    image_array = np.array(image) / 255.0  # Normalize pixel values
-    if image_array.shape[-1] != 3:  # Ensure the image has 3 color channels (RGB)
-        raise ValueError("Input image must have 3 color channels (RGB).")
-    
-    image_array = np.expand_dims(image_array, axis=0)  # Add batch dimension
-    return image_array
 
 
+@app.route('/availability')
+def availability():
+    # Remaining slots per day for the booking calendar, e.g. /availability?start=2026-11-01&end=2026-11-30
+    try:
+        start_date = datetime.strptime(request.args.get('start', ''), "%Y-%m-%d").date()
+        end_date = datetime.strptime(request.args.get('end', ''), "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"error": "start and end must be dates in YYYY-MM-DD format"}), 400
+
+    if end_date < start_date or (end_date - start_date).days > 366:
+        return jsonify({"error": "The date range must be between 1 and 367 days long"}), 400
+
+    return jsonify(get_availability(start_date, end_date))
+
 
 @app.route('/', methods=['POST', 'GET'])
 def homepage():
@@ -355,25 +504,10 @@ def homepage():
         if save_booking(name, email, phone, date, message):
             flash("Booking successfully made!", "success")
 
-            sender_email = "chavansiddhesh105477@gmail.com"  # Replace with your Gmail address
-            receiver_email = email
-            password = "irld qqpj tmvx lsih"  # Replace with your Gmail password or app password
-
-            msg = MIMEMultipart()
-            msg['From'] = sender_email
-            msg['To'] = receiver_email
-            msg['Subject'] = "Appointment Scheduled"
+            # The confirmation is sent in the background so the booking returns straight away
             body = f"Hello {name},\n\nYour appointment is scheduled for {date}. We look forward to seeing you!\n\nBest regards,\nPratish Clinic"
-            msg.attach(MIMEText(body, 'plain'))
+            send_email(email, "Appointment Scheduled", body)
 
-            try:
-                with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                    server.login(sender_email, password)
-                    server.sendmail(sender_email, receiver_email, msg.as_string())
-                print("Email sent successfully!")
-            except Exception as e:
-                print(f"Failed to send email: {e}")
-            
             return redirect(url_for('homepage'))
 
         return redirect(url_for('homepage'))
@@ -385,6 +519,23 @@ def homepage():
 
 
 
+def requested_tta_views():
+    """Number of test-time augmentation views asked for with ?tta=K, raising ValueError if it is out of range."""
+    try:
+        views = int(request.values.get('tta', TTA_DEFAULT_VIEWS))
+    except ValueError:
+        raise ValueError("tta must be an integer") from None
+    if not 1 <= views <= MAX_VIEWS:
+        raise ValueError(f"tta must be between 1 and {MAX_VIEWS}")
+    return views
+
+
+def cache_version(model_name, views):
+    # TTA and single-view predictions of the same image are cached separately
+    version = registry.version(model_name)
+    return version if views == 1 else f"{version}+tta{views}"
+
+
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_image():
     if request.method == 'POST':
@@ -396,43 +547,214 @@ def upload_image():
         if file.filename == '':
             return "No selected file", 400
 
-        # Secure the filename and create uploads directory if it doesn't exist
+        # Pick the model by name or name:version, e.g. ?model=sequential or model=hybridcnn:3
+        try:
+            model_name = registry.resolve(request.values.get('model'))
+            views = requested_tta_views()
+        except (KeyError, ValueError) as e:
+            return str(e), 400
+
+        # Secure the filename; the uploads directory is created by the writer
         filename = secure_filename(file.filename)
         uploads_dir = 'static/uploads'
-
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-
         img_path = os.path.join(uploads_dir, filename)
-        print(f"Saving image to: {img_path}")  # Debug print
-        file.save(img_path)  # Save the file to the uploads directory
 
-        # Open and preprocess the image
-        img = Image.open(file)
+        # Hashed and spooled while the body was parsed
         try:
-            img_array = preprocess_image(img)  # Ensure correct image format
-        except ValueError as e:
-            return str(e), 400  # If the image is not in RGB format, return an error
+            upload = take_upload(file, app.config['MAX_CONTENT_LENGTH'])
+        except UploadTooLarge as e:
+            return str(e), 413
+
+        cache_key = PredictionCache.key(upload.digest, model_name, cache_version(model_name, views))
+        prediction = prediction_cache.get(cache_key)
+        img_array = None
+        if prediction is None:
+            # Open and preprocess the image straight from the upload buffer
+            try:
+                with upload.open() as stream:
+                    img_array = preprocess_image(Image.open(stream))
+            except (ValueError, OSError) as e:
+                upload.discard()
+                return f"Could not read image: {e}", 400
+
+        # Asynchronous mode: hand inference to the worker pool and return a job id. A cached
+        # prediction becomes a job that is already done, so the client gets the same response.
+        if request.values.get('async') == '1':
+            if prediction is None:
+                job_id = job_queue.submit(model_name, registry.path(model_name), registry.labels(model_name), img_array,
+                                          tta_views=views)
+            else:
+                job_id = job_queue.submit_result(model_name, registry.labels(model_name), prediction)
+            upload_writer.persist(upload, img_path)
+            return jsonify({
+                "job_id": job_id,
+                "status_url": url_for('job_status', job_id=job_id),
+                "events_url": url_for('job_events', job_id=job_id),
+            }), 202
+
+        if prediction is None:
+            # Make prediction using the selected model (loaded on first use), averaged over the TTA views
+            prediction = predict_tta(registry.batcher(model_name).predict, img_array, views)
+            prediction_cache.put(cache_key, prediction)
 
-        # Make prediction using the HybridCNN model
-        prediction = HybridCNN.predict(img_array)  # Model is correctly loaded here
         pred_label = np.argmax(prediction, axis=1)[0]
-        pred_class = classes[pred_label]
+        pred_class = registry.labels(model_name)[pred_label]
+
+        if img_array is not None and registry.shadow is not None:
+            registry.shadow.maybe_submit(img_array, pred_class)
+
+        # Remember the result so the chat can explain it, and start a fresh conversation
+        session['diagnosis'] = {
+            "class_name": pred_class,
+            "top_k": top_k(prediction[0], registry.labels(model_name), k=3),
+        }
+        session['chat_history'] = []
+
+        print(f"Saving image to: {img_path}")  # Debug print
+        upload_writer.persist(upload, img_path)
 
         # Render the result page with the predicted class and image
         return render_template('result.html', class_name=pred_class, image_path=filename)
 
     return render_template('upload.html')
 
+@app.route('/api/predict', methods=['POST'])
+def api_predict():
+    # JSON counterpart of /upload: the full probability vector, the top k classes and a calibrated confidence
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        model_name = registry.resolve(request.values.get('model'))
+        k = int(request.values.get('k', '3'))
+        views = requested_tta_views()
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        upload = take_upload(file, app.config['MAX_CONTENT_LENGTH'])
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+
+    version = registry.version(model_name)
+    cache_key = PredictionCache.key(upload.digest, model_name, cache_version(model_name, views))
+    prediction = prediction_cache.get(cache_key)
+    if prediction is None:
+        try:
+            with upload.open() as stream:
+                img_array = preprocess_image(Image.open(stream))
+        except (ValueError, OSError) as e:
+            return jsonify({"error": f"Could not read image: {e}"}), 400
+        finally:
+            # The API doesn't keep the uploaded image
+            upload.discard()
+        prediction = predict_tta(registry.batcher(model_name).predict, img_array, views)
+        prediction_cache.put(cache_key, prediction)
+    else:
+        upload.discard()
+
+    labels = registry.labels(model_name)
+    temperature = temperature_for(calibration, model_name, version)
+    calibrated = apply_temperature(prediction[0], temperature)
+    pred_label = int(np.argmax(prediction[0]))
+    return jsonify({
+        "model": model_name,
+        "version": version,
+        "label": pred_label,
+        "class_name": labels.get(pred_label, str(pred_label)),
+        "confidence": float(calibrated[pred_label]),
+        "temperature": temperature,
+        "tta_views": views,
+        "probabilities": {labels.get(i, str(i)): float(p) for i, p in enumerate(prediction[0])},
+        "calibrated_probabilities": {labels.get(i, str(i)): float(p) for i, p in enumerate(calibrated)},
+        "top_k": [{"class_name": name, "probability": probability}
+                  for name, probability in top_k(calibrated, labels, k=max(1, k))],
+    })
+
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    # Accepts several files under 'files' (ZIP archives are expanded) and streams back one result per image
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files:
+        return "No files uploaded", 400
+
+    try:
+        model_name = registry.resolve(request.values.get('model'))
+    except KeyError as e:
+        return str(e), 400
+
+    # Taken over now: the request closes its files before the streamed response below is generated
+    uploads = [(file.filename, take_upload(file, app.config['BATCH_MAX_CONTENT_LENGTH'])) for file in files
+               if file.filename]
+    labels = registry.labels(model_name)
+    engine = registry.engine(model_name)
+    results = score_images(
+        iter_uploaded_images(uploads),
+        engine.predict,
+        labels,
+        batch_size=int(os.getenv("BATCH_UPLOAD_SIZE", "32")),
+        decode_workers=int(os.getenv("BATCH_DECODE_WORKERS", "4")),
+    )
+
+    if request.values.get('format') == 'csv':
+        return Response(stream_with_context(to_csv(results, labels)), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=predictions.csv'})
+    return Response(stream_with_context(to_ndjson(results)), mimetype='application/x-ndjson')
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-Sent Events: one message per status change until the job is done or failed
+    return Response(stream_with_context(job_queue.events(job_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
 # def get_gemini_response(question):
 #     model = genai.GenerativeModel('gemini-pro')
 #     response = model.generate_content(question)
 #     return response.text
 
+# One long-lived chat backend per process: gemini, or faq/fake which answer offline
+chat_service = ChatService(
+    create_backend(os.getenv("CHAT_BACKEND", "gemini"),
+                   model_name=os.getenv("GEMINI_MODEL", "models/gemini-1.5-pro-latest"),
+                   api_key=os.getenv("GOOGLE_API_KEY"),
+                   faq_path=os.getenv("CHAT_FAQ_PATH", "faq.json")),
+    ResponseCache(max_entries=int(os.getenv("CHAT_CACHE_SIZE", "512")),
+                  ttl_seconds=float(os.getenv("CHAT_CACHE_TTL", "3600"))),
+)
+
+
+# Per-class background text for explaining a diagnosis, taken from the FAQ corpus
+knowledge_snippets = class_snippets(load_faq(os.getenv("CHAT_FAQ_PATH", "faq.json")))
+
+# Number of earlier question/answer pairs carried into each prompt
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "3"))
+
+
+def chat_prompt(question):
+    """Build (prompt, response cache key) for a question from the session's diagnosis and recent chat turns."""
+    context = None
+    class_name = None
+    diagnosis = session.get('diagnosis')
+    if diagnosis:
+        class_name = diagnosis["class_name"]
+        context = build_context(class_name, diagnosis["top_k"], knowledge_snippets.get(class_name))
+    history = session.get('chat_history', [])[-CHAT_HISTORY_TURNS:]
+    return build_prompt(question, context, history, max_turns=CHAT_HISTORY_TURNS), cache_key(question, class_name, history)
+
+
 def get_gemini_response(question):
-    model = genai.GenerativeModel("models/gemini-1.5-pro-latest")
-    response = model.generate_content(question)
-    return response.text
+    return chat_service.answer(*chat_prompt(question))
 
 # Home route
 @app.route("/chat", methods=["GET", "POST"])
@@ -441,9 +763,44 @@ def chat():
     if request.method == "POST":
         input_text = request.form["input"]
         response = get_gemini_response(input_text)
-    return render_template("chat.html", response=response)
+        # Keep only the window that future prompts use, so the session cookie stays small
+        history = session.get('chat_history', []) + [(input_text[:300], response[:300])]
+        session['chat_history'] = history[-CHAT_HISTORY_TURNS:]
+    return render_template("chat.html", response=response, diagnosis=session.get('diagnosis'))
+
+
+@app.route("/chat/stream")
+def chat_stream():
+    # Server-Sent Events: the page can show the answer as it is generated, e.g. /chat/stream?input=...
+    input_text = request.args.get("input", "").strip()
+    if not input_text:
+        return "No question asked", 400
+    # Uses the diagnosis context too; turns are only recorded by the /chat form, since the
+    # session cookie can't be updated once the stream has started
+    return Response(stream_with_context(sse(chat_service.stream(*chat_prompt(input_text)))), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route("/models")
+def list_models():
+    models = registry.memory()
+    for name, entry in models.items():
+        entry["labels"] = registry.labels(name)
+    shadow = registry.shadow.summary() if registry.shadow is not None else None
+    return jsonify({"default": registry.resolve(), "models": models, "shadow": shadow})
+
+
+@app.route("/metrics/cache")
+def cache_metrics():
+    return jsonify(prediction_cache.summary())
+
+
+@app.route("/metrics/startup")
+def startup_metrics():
+    return jsonify({name: round(seconds, 4) for name, seconds in timings.items()})
 
 
 # Run the app
 if __name__ == '__main__':
+    start_services()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Exercise the Flask app through its WSGI interface with the shipped sequential model.
+
+    python -m pytest test_app.py
+"""
+import glob
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+import pytest
+
+pytest.importorskip("tensorflow")
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("app")
+    os.environ.update(DATABASE_PATH=str(directory / "app.db"), JOBS_DB_PATH=str(directory / "jobs.db"),
+                      MODEL_BUNDLES_DIR=str(directory / "artifacts"), CHAT_BACKEND="fake")
+    import test
+    test.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return test.app
+
+
+def png(seed, size=(64, 48)):
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, format="PNG")
+    return out.getvalue()
+
+
+def results(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_batch_upload_of_a_zip_and_loose_files(app):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        for i in range(3):
+            z.writestr(f"lesions/{i}.png", png(i))
+        z.writestr("lesions/notes.txt", "not an image")
+    files = [(archive.getvalue(), "lesions.zip"), (png(10), "a.png"), (png(11, size=(900, 700)), "b.png"),
+             (b"garbage", "c.jpg"), (b"garbage", "broken.zip")]
+    spooled = set(glob.glob(os.path.join(tempfile.gettempdir(), "upload-*")))
+
+    response = app.test_client().post(
+        "/upload/batch?model=sequential",
+        data={"files": [(io.BytesIO(data), name) for data, name in files]},
+        content_type="multipart/form-data")
+    rows = results(response)
+
+    assert [row["filename"] for row in rows] == ["lesions/0.png", "lesions/1.png", "lesions/2.png",
+                                                 "a.png", "b.png", "c.jpg", "broken.zip"]
+    for row in rows[:5]:
+        assert "error" not in row
+        assert sum(row["probabilities"].values()) == pytest.approx(1.0, abs=1e-4)
+    assert rows[5]["error"].startswith("Could not read image")
+    assert rows[6]["error"] == "Could not read image: Not a valid ZIP archive"
+    # b.png is large enough to be spooled to disk; nothing is left behind
+    assert set(glob.glob(os.path.join(tempfile.gettempdir(), "upload-*"))) == spooled
+
+
+def test_batch_upload_results_match_single_predictions(app):
+    client = app.test_client()
+    rows = results(client.post("/upload/batch?model=sequential",
+                               data={"files": [(io.BytesIO(png(i)), f"{i}.png") for i in range(3)]},
+                               content_type="multipart/form-data"))
+    for i, row in enumerate(rows):
+        single = client.post("/api/predict?model=sequential", data={"file": (io.BytesIO(png(i)), f"{i}.png")},
+                             content_type="multipart/form-data").get_json()
+        assert row["class_name"] == single["class_name"]
+        assert row["probabilities"] == pytest.approx(single["probabilities"], abs=1e-5)
+
+
+def test_async_upload_of_a_cached_image_still_returns_a_job(app):
+    client = app.test_client()
+    image = png(20)
+    # Fills the prediction cache for this image and model
+    expected = client.post("/api/predict?model=sequential", data={"file": (io.BytesIO(image), "cached.png")},
+                           content_type="multipart/form-data").get_json()
+
+    response = client.post("/upload?model=sequential&async=1", data={"file": (io.BytesIO(image), "cached.png")},
+                           content_type="multipart/form-data")
+    saved = os.path.join("static", "uploads", "cached.png")
+    try:
+        assert response.status_code == 202
+        job = client.get(response.get_json()["status_url"]).get_json()
+        assert job["status"] == "done"
+        assert job["result"][0]["class_name"] == expected["class_name"]
+        assert job["result"][0]["probabilities"] == pytest.approx(expected["probabilities"], abs=1e-6)
+    finally:
+        # The upload is saved in the background
+        deadline = time.monotonic() + 5
+        while not os.path.exists(saved) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if os.path.exists(saved):
+            os.remove(saved)
+            try:
+                os.removedirs(os.path.dirname(saved))
+            except OSError:
+                pass
@@ -0,0 +1,39 @@
+"""Check how train.py bundles are registered next to the shipped models.
+
+    python -m pytest test_bundles.py
+"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from bundles import BUNDLE_FILE, MODEL_FILE, register_bundles, resolve_model
+from models import register_shipped_models
+from preprocessing import PREPROCESSING_SPEC
+from registry import ModelRegistry
+
+
+def fake_bundle(root, name, version):
+    directory = os.path.join(root, name, str(version))
+    os.makedirs(directory)
+    with open(os.path.join(directory, BUNDLE_FILE), "w") as f:
+        json.dump({"name": name, "version": str(version), "model_file": MODEL_FILE, "labels": {"0": "Nevus"},
+                   "preprocessing": PREPROCESSING_SPEC}, f)
+    return directory
+
+
+def test_bundle_versions_never_collide_with_shipped_ones(tmp_path):
+    # The shipped hybridcnn is version "3"
+    directory = fake_bundle(str(tmp_path), "hybridcnn", 3)
+    models = ModelRegistry()
+    register_shipped_models(models)
+    register_bundles(models, str(tmp_path))
+
+    assert models.version("hybridcnn") == "bundle-3"
+    assert models.resolve("hybridcnn:bundle-3") == "hybridcnn"
+    with pytest.raises(KeyError):
+        models.resolve("hybridcnn:3")
+    # calibration.py records the same version the app serves
+    assert resolve_model(directory)["version"] == "bundle-3"
@@ -0,0 +1,43 @@
+"""Check the prediction cache's in-memory and on-disk tiers.
+
+    python -m pytest test_cache.py
+"""
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import cache
+from cache import PredictionCache
+
+
+def rows(cache):
+    conn = sqlite3.connect(cache.disk_path)
+    keys = [row[0] for row in conn.execute("SELECT key FROM predictions ORDER BY created")]
+    conn.close()
+    return keys
+
+
+def test_disk_tier_is_capped_to_the_newest_rows(tmp_path):
+    predictions = PredictionCache(max_entries=2, disk_path=str(tmp_path / "cache.db"), disk_max_entries=3)
+    for i in range(5):
+        predictions.put(f"m:1:{i}", np.full((1, 3), i, dtype=np.float32))
+
+    assert rows(predictions) == ["m:1:2", "m:1:3", "m:1:4"]
+    assert predictions.stats["disk_evictions"] == 2
+    # Evicted from memory but still on disk
+    assert predictions.get("m:1:2")[0, 0] == 2
+    assert predictions.get("m:1:0") is None
+
+
+def test_disk_tier_drops_expired_rows_on_put(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    predictions = PredictionCache(ttl_seconds=60, disk_path=str(tmp_path / "cache.db"))
+    predictions.put("m:1:old", np.zeros((1, 3)))
+    now[0] += 61
+    predictions.put("m:1:new", np.ones((1, 3)))
+
+    assert rows(predictions) == ["m:1:new"]
+    assert predictions.get("m:1:old") is None
@@ -0,0 +1,40 @@
+"""Check the keras, function and tflite inference backends against each other on the shipped models.
+
+    python -m pytest test_inference.py
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from keras.models import load_model
+
+from inference import BACKENDS, INPUT_SHAPE, check_parity, convert_to_tflite, create_engine, engine_from_path
+
+MODELS = {"hybridcnn": "skin_cancerr.h5", "sequential": "skin_model.keras"}
+
+
+@pytest.fixture(scope="module", params=sorted(MODELS))
+def model(request):
+    return load_model(MODELS[request.param])
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_backend_matches_model_predict(model, backend):
+    assert check_parity(model, create_engine(model, backend), samples=16) <= 1e-4
+
+
+def test_backends_agree_with_each_other(model):
+    batch = np.random.default_rng(1).random((8,) + INPUT_SHAPE, dtype=np.float32)
+    outputs = {backend: create_engine(model, backend).predict(batch) for backend in BACKENDS}
+    for backend, output in outputs.items():
+        np.testing.assert_allclose(output, outputs["keras"], atol=1e-4, err_msg=backend)
+
+
+def test_exported_flatbuffer_loads_from_disk(model, tmp_path):
+    path = tmp_path / "model.tflite"
+    path.write_bytes(convert_to_tflite(model))
+    engine = engine_from_path(str(path))
+
+    assert engine.name == "tflite"
+    assert check_parity(model, engine, samples=16) <= 1e-4
@@ -0,0 +1,138 @@
+"""Run the mail dispatcher against a stub smtplib.SMTP and check delivery and outbox status transitions.
+
+    python -m pytest test_mailer.py
+"""
+import smtplib
+import time
+
+import pytest
+
+import mailer
+from database import Database
+from mailer import MailDispatcher
+
+
+class StubSMTP:
+    """Stands in for smtplib.SMTP, recording messages and refusing recipients listed in refuse."""
+
+    sent = []
+    refuse = set()
+
+    def __init__(self, host, port, timeout=None):
+        self.host = host
+        self.port = port
+
+    def login(self, username, password):
+        pass
+
+    def noop(self):
+        return 250, b"OK"
+
+    def sendmail(self, sender, recipient, message):
+        if recipient in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({recipient: (550, b"No such user")})
+        self.sent.append((sender, recipient, message))
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    StubSMTP.sent = []
+    StubSMTP.refuse = set()
+    monkeypatch.setattr(mailer.smtplib, "SMTP", StubSMTP)
+    return StubSMTP
+
+
+def dispatcher(tmp_path, **kwargs):
+    options = dict(host="localhost", port=8025, sender="clinic@example.com", use_ssl=False, poll_seconds=0.05)
+    options.update(kwargs)
+    return MailDispatcher(Database(str(tmp_path / "mail.db")), **options)
+
+
+def statuses(dispatcher):
+    return dict(dispatcher.database.fetchall("SELECT recipient, status FROM outbox"))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_background_delivery(tmp_path, smtp):
+    mail = dispatcher(tmp_path)
+    mail.start()
+    mail.enqueue("a@example.com", "Appointment", "See you soon")
+    campaign_id = mail.create_campaign("News", "Hello", ["b@example.com", "c@example.com"])
+
+    assert wait_for(lambda: mail.stats() == {"sent": 3})
+    assert sorted(recipient for _, recipient, _ in smtp.sent) == ["a@example.com", "b@example.com", "c@example.com"]
+    assert all(sender == "clinic@example.com" for sender, _, _ in smtp.sent)
+    assert "Subject: Appointment" in smtp.sent[0][2]
+    assert mail.campaign_progress(campaign_id)["progress"] == 1.0
+
+
+def test_failed_delivery_is_retried_then_marked_failed(tmp_path, smtp):
+    smtp.refuse = {"bad@example.com"}
+    mail = dispatcher(tmp_path, max_attempts=2, backoff_seconds=0)
+    mail.enqueue("bad@example.com", "Appointment", "See you soon")
+    mail.enqueue("good@example.com", "Appointment", "See you soon")
+    mail.start()
+
+    assert wait_for(lambda: statuses(mail) == {"bad@example.com": "failed", "good@example.com": "sent"})
+    attempts, last_error, claimed_by = mail.database.fetchone(
+        "SELECT attempts, last_error, claimed_by FROM outbox WHERE recipient = 'bad@example.com'")
+    assert attempts == 2
+    assert "No such user" in last_error
+    assert claimed_by is None
+
+
+def test_rate_limit_is_shared_between_dispatchers(tmp_path, smtp):
+    first = dispatcher(tmp_path, rate_per_minute=600, connections=2)
+    second = dispatcher(tmp_path, rate_per_minute=600, connections=2)
+    first.create_campaign("News", "Hello", [f"user{i}@example.com" for i in range(6)])
+    start = time.monotonic()
+    first.start()
+    second.start()
+
+    assert wait_for(lambda: first.stats() == {"sent": 6})
+    # 0.1 s between messages across all four connections, not per connection
+    assert time.monotonic() - start >= 0.45
+    assert sorted(recipient for _, recipient, _ in smtp.sent) == [f"user{i}@example.com" for i in range(6)]
+
+
+def test_reclaimed_message_is_not_sent_by_its_old_claimant(tmp_path, smtp):
+    # No worker threads: the claim and send are driven by hand
+    mail = dispatcher(tmp_path, connections=0)
+    other = dispatcher(tmp_path, connections=0)
+    mail.enqueue("a@example.com", "Appointment", "See you soon")
+    rows = mail._claim()
+    # Another dispatcher takes the message over, as if this one had stalled past claim_timeout_seconds
+    other.database.execute("UPDATE outbox SET claimed_by = ?", (other.worker_id,))
+    mail._send_batch(rows)
+
+    assert smtp.sent == []
+    assert other.database.fetchone("SELECT status, claimed_by FROM outbox") == ("sending", other.worker_id)
+
+
+def test_claims_are_sized_from_the_rate(tmp_path):
+    assert dispatcher(tmp_path)._claim_size() == 50
+    assert dispatcher(tmp_path, rate_per_minute=20)._claim_size() == 10
+    assert dispatcher(tmp_path, rate_per_minute=1)._claim_size() == 1
+
+
+def test_unconfigured_dispatcher_only_queues(tmp_path, smtp, monkeypatch):
+    for name in ("SMTP_HOST", "SMTP_USERNAME", "SMTP_PASSWORD", "SMTP_SENDER"):
+        monkeypatch.delenv(name, raising=False)
+    mail = MailDispatcher.from_env(Database(str(tmp_path / "mail.db")))
+    mail.start()
+    mail.enqueue("a@example.com", "Appointment", "See you soon")
+
+    assert not mail.configured
+    assert mail.stats() == {"pending": 1}
+    assert smtp.sent == []
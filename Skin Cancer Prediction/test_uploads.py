@@ -0,0 +1,59 @@
+"""Check that uploads are hashed and spooled while the form is parsed, and handed over without another copy.
+
+    python -m pytest test_uploads.py
+"""
+import hashlib
+import io
+import os
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from uploads import SpooledUpload, take_upload
+
+
+class SpoolingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload(spool_bytes=1024)
+
+
+def parse(data):
+    builder = EnvironBuilder(method="POST", data={"file": (io.BytesIO(data), "lesion.jpg")})
+    return SpoolingRequest(builder.get_environ())
+
+
+def test_small_upload_stays_in_memory():
+    data = b"x" * 100
+    request = parse(data)
+    upload = take_upload(request.files["file"], max_bytes=10 ** 6)
+    request.close()
+
+    assert upload.path is None
+    assert upload.data == data
+    assert upload.size == len(data)
+    assert upload.digest == hashlib.sha256(data).hexdigest()
+
+
+def test_large_upload_is_spooled_once_and_survives_the_request():
+    data = os.urandom(5000)
+    request = parse(data)
+    upload = take_upload(request.files["file"], max_bytes=10 ** 6)
+    request.close()
+
+    try:
+        assert upload.data is None
+        assert os.path.basename(upload.path).startswith("upload-")
+        assert upload.digest == hashlib.sha256(data).hexdigest()
+        with upload.open() as stream:
+            assert stream.read() == data
+    finally:
+        upload.discard()
+    assert not os.path.exists(upload.path)
+
+
+def test_spool_is_removed_when_the_upload_is_not_taken():
+    request = parse(os.urandom(5000))
+    path = request.files["file"].stream._path
+    assert os.path.exists(path)
+    request.close()
+    assert not os.path.exists(path)
@@ -0,0 +1,178 @@
+"""Train one of the notebook's architectures from an image store with a streaming tf.data pipeline.
+
+Runs headless on CPU and writes a versioned bundle (see bundles.py) that the web app picks up:
+
+    python train.py merged_RGB.dataset --arch hybridcnn --epochs 50
+    python train.py merged_RGB.dataset --arch hybridcnn --epochs 3 --loader notebook   # the notebook's approach, for comparison
+"""
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback, ReduceLROnPlateau, EarlyStopping
+
+from architectures import ARCHITECTURES, build_model
+from bundles import write_bundle
+from dataset import IMAGE_SHAPE, fingerprint, is_dataset, load_arrays, open_dataset, split_rows
+from models import classes
+from pipeline import training_dataset, evaluation_dataset, steps_per_epoch
+from preprocessing import pixels_to_batch
+
+
+class EpochTimer(Callback):
+    """Record the wall time of every training epoch."""
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.seconds.append(time.perf_counter() - self._start)
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def notebook_datasets(images, labels, train_rows, val_rows, batch_size, seed):
+    """The notebook's approach: oversample by duplicating rows in memory, then ImageDataGenerator.flow."""
+    from imblearn.over_sampling import RandomOverSampler
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    flat = np.asarray(images[train_rows]).reshape(len(train_rows), -1)
+    X, y = RandomOverSampler(random_state=seed).fit_resample(flat, labels[train_rows])
+    X = pixels_to_batch(X)
+    datagen = ImageDataGenerator(rotation_range=20, width_shift_range=0.2, height_shift_range=0.2, shear_range=0.2,
+                                 zoom_range=0.2, horizontal_flip=True, fill_mode='nearest')
+    validation = (pixels_to_batch(images[val_rows]), labels[val_rows])
+    return datagen.flow(X, y, batch_size=batch_size, seed=seed), validation, len(X) // batch_size
+
+
+def validation_metrics(probabilities, y_true, num_classes):
+    """Accuracy, log loss, per-class precision/recall and the confusion matrix (rows are true labels)."""
+    predicted = probabilities.argmax(axis=1)
+    confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(confusion, (y_true, predicted), 1)
+    true_counts = confusion.sum(axis=1)
+    predicted_counts = confusion.sum(axis=0)
+    diagonal = np.diag(confusion)
+    return {
+        "samples": int(len(y_true)),
+        "accuracy": float(np.mean(predicted == y_true)),
+        "loss": float(-np.mean(np.log(np.clip(probabilities[np.arange(len(y_true)), y_true], 1e-7, 1.0)))),
+        "precision": {str(c): float(diagonal[c] / predicted_counts[c]) if predicted_counts[c] else None
+                      for c in range(num_classes)},
+        "recall": {str(c): float(diagonal[c] / true_counts[c]) if true_counts[c] else None for c in range(num_classes)},
+        "confusion_matrix": confusion.tolist(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a skin lesion classifier from an image store.")
+    parser.add_argument("source", help="Image store (see dataset.py) or pixel CSV")
+    parser.add_argument("--arch", default="hybridcnn", choices=sorted(ARCHITECTURES))
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--steps-per-epoch", type=int, default=None,
+                        help="Batches per epoch; one pass over the training rows by default")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--loader", default="stream", choices=["stream", "notebook"],
+                        help="stream: balanced tf.data pipeline; notebook: in-memory oversampling + ImageDataGenerator")
+    parser.add_argument("--no-balance", action="store_true", help="Sample rows uniformly instead of per class")
+    parser.add_argument("--name", default=None, help="Bundle name, which is the model name in the app; defaults to --arch")
+    parser.add_argument("--artifacts", default=os.getenv("MODEL_BUNDLES_DIR", "artifacts"), help="Bundle root directory")
+    parser.add_argument("--version", type=int, default=None, help="Bundle version; the next free one by default")
+    parser.add_argument("--threads", type=int, default=0, help="TensorFlow CPU threads; 0 lets TensorFlow decide")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Use deterministic kernels, so a rerun with the same seed gives the same weights (slower)")
+    args = parser.parse_args()
+
+    tf.keras.utils.set_random_seed(args.seed)
+    if args.deterministic:
+        tf.config.experimental.enable_op_determinism()
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+        tf.config.threading.set_inter_op_parallelism_threads(args.threads)
+
+    wall_start = time.perf_counter()
+    images, labels = load_arrays(args.source)
+    labels = np.asarray(labels)
+    num_classes = int(labels.max()) + 1
+    train_rows, val_rows = split_rows(labels, seed=args.seed)
+    counts = np.bincount(labels[train_rows], minlength=num_classes)
+    print(f"{len(train_rows)} training / {len(val_rows)} validation images, "
+          f"imbalance ratio {counts.max() / max(counts.min(), 1):.1f}:1")
+
+    if args.loader == "stream":
+        train = training_dataset(images, labels, train_rows, args.batch_size, seed=args.seed,
+                                 balanced=not args.no_balance)
+        validation = evaluation_dataset(images, labels, val_rows)
+        steps = args.steps_per_epoch or steps_per_epoch(train_rows, args.batch_size)
+    else:
+        train, validation, steps = notebook_datasets(images, labels, train_rows, val_rows, args.batch_size, args.seed)
+        steps = args.steps_per_epoch or steps
+    print(f"Input pipeline ready, peak memory {peak_memory_mb():.0f} MB")
+
+    model = build_model(args.arch, IMAGE_SHAPE, num_classes)
+    timer = EpochTimer()
+    callbacks = [
+        ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, verbose=1),
+        EarlyStopping(monitor='val_loss', patience=5, verbose=1, restore_best_weights=True),
+        timer,
+    ]
+    history = model.fit(train, steps_per_epoch=steps, validation_data=validation, epochs=args.epochs,
+                        callbacks=callbacks)
+
+    # The first epoch includes graph tracing, so it is reported separately
+    later = timer.seconds[1:] or timer.seconds
+    images_per_epoch = steps * args.batch_size
+    samples_per_second = images_per_epoch * len(timer.seconds) / sum(timer.seconds)
+    print(f"{args.loader} loader: first epoch {timer.seconds[0]:.1f}s, then {np.mean(later):.1f}s per epoch "
+          f"({images_per_epoch / np.mean(later):.0f} images/s), peak memory {peak_memory_mb():.0f} MB")
+
+    y_val = labels[val_rows]
+    probabilities = model.predict(evaluation_dataset(images, labels, val_rows), verbose=0)
+    metrics = validation_metrics(probabilities, y_val, num_classes)
+    print(f"Validation accuracy {metrics['accuracy']:.4f}, loss {metrics['loss']:.4f}")
+
+    training = {
+        "architecture": args.arch,
+        "loader": args.loader,
+        "balanced": args.loader == "notebook" or not args.no_balance,
+        "seed": args.seed,
+        "deterministic": args.deterministic,
+        "epochs_requested": args.epochs,
+        "epochs_run": len(timer.seconds),
+        "batch_size": args.batch_size,
+        "steps_per_epoch": steps,
+        "final_learning_rate": float(tf.keras.backend.get_value(model.optimizer.learning_rate)),
+        "history": {key: [float(v) for v in values] for key, values in history.history.items()},
+        "epoch_seconds": timer.seconds,
+        "samples_per_second": samples_per_second,
+        "wall_seconds": time.perf_counter() - wall_start,
+        "peak_memory_mb": peak_memory_mb(),
+    }
+    data = {
+        "source": os.path.abspath(args.source),
+        "sha256": fingerprint(args.source),
+        "store": open_dataset(args.source).metadata if is_dataset(args.source) else None,
+        "validation_fraction": 0.2,
+        "train_samples": int(len(train_rows)),
+        "validation_samples": int(len(val_rows)),
+        "train_class_counts": {str(c): int(n) for c, n in enumerate(counts)},
+    }
+    label_map = {label: classes.get(label, str(label)) for label in range(num_classes)}
+    directory = write_bundle(args.artifacts, args.name or args.arch, model, label_map, training, data, metrics,
+                             version=args.version)
+    print(f"Trained in {training['wall_seconds']:.1f}s at {samples_per_second:.0f} samples/s; bundle written to {directory}")
+
+
+if __name__ == '__main__':
+    main()
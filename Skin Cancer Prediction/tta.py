@@ -0,0 +1,66 @@
+"""Test-time augmentation: average the model's output over flipped/rotated views of an image.
+
+The views stay within what the notebook's ImageDataGenerator showed the models
+in training (horizontal flips, rotations up to 20 degrees), and all of them go
+through the model as one batch.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# (horizontal flip, rotation in degrees), in the order views are added as K grows
+VIEWS = [
+    (False, 0), (True, 0),
+    (False, 10), (False, -10),
+    (True, 10), (True, -10),
+    (False, 20), (False, -20),
+]
+MAX_VIEWS = len(VIEWS)
+
+
+@lru_cache(maxsize=32)
+def _index_maps(k, height, width):
+    """Flat source-pixel indices for the first k views, shape (k, height * width).
+
+    Rotations use nearest-neighbour sampling and clamp at the border, like
+    fill_mode='nearest' in training. Maps are computed once per (k, size).
+    """
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float64)
+    cy, cx = (height - 1) / 2, (width - 1) / 2
+    maps = np.empty((k, height * width), dtype=np.intp)
+    for i, (flip, degrees) in enumerate(VIEWS[:k]):
+        x = (width - 1 - xs) if flip else xs
+        # Inverse rotation: for each output pixel, where it comes from in the source
+        theta = np.deg2rad(degrees)
+        src_x = np.cos(theta) * (x - cx) + np.sin(theta) * (ys - cy) + cx
+        src_y = -np.sin(theta) * (x - cx) + np.cos(theta) * (ys - cy) + cy
+        src_x = np.clip(np.rint(src_x), 0, width - 1).astype(np.intp)
+        src_y = np.clip(np.rint(src_y), 0, height - 1).astype(np.intp)
+        maps[i] = (src_y * width + src_x).ravel()
+    return maps
+
+
+def augment(images, k):
+    """Turn an (N, height, width, channels) array into an (N * k, height, width, channels) batch.
+
+    The k views of each image are consecutive rows.
+    """
+    if not 1 <= k <= MAX_VIEWS:
+        raise ValueError(f"TTA views must be between 1 and {MAX_VIEWS}")
+    if k == 1:
+        return images
+    n, height, width, channels = images.shape
+    # One gather builds every view of every image at once
+    pixels = images.reshape(n, height * width, channels)
+    return pixels[:, _index_maps(k, height, width)].reshape(n * k, height, width, channels)
+
+
+def average_views(predictions, k):
+    """Collapse (N * k, num_classes) outputs back to one (N, num_classes) row per image."""
+    predictions = np.asarray(predictions)
+    return predictions.reshape(-1, k, predictions.shape[-1]).mean(axis=1)
+
+
+def predict_tta(predict_fn, images, k):
+    """Predict an (N, height, width, channels) array with k views per image in a single forward pass."""
+    return average_views(predict_fn(augment(images, k)), k)
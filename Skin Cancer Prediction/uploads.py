@@ -0,0 +1,162 @@
+import hashlib
+import io
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadBuffer:
+    """An upload read exactly once: kept in memory when small, spooled to a temp file when large."""
+
+    def __init__(self, data=None, path=None, size=0, digest=None):
+        self.data = data
+        self.path = path
+        self.size = size
+        self.digest = digest
+
+    def open(self):
+        """Return a fresh binary stream over the upload for decoding."""
+        if self.data is not None:
+            # BytesIO shares the bytes object until it is written to, so this does not copy
+            return io.BytesIO(self.data)
+        return open(self.path, 'rb')
+
+    def discard(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class SpooledUpload:
+    """Writable stream a form parser fills with one uploaded file, hashing and spooling it as the bytes arrive.
+
+    The app's request class hands these to Werkzeug, so an upload is written
+    once, while it is received, and detach() turns it into an UploadBuffer
+    without reading it again.
+    """
+
+    def __init__(self, spool_bytes=1024 * 1024):
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = io.BytesIO()
+        self._path = None
+        self._detached = False
+
+    def write(self, data):
+        self.size += len(data)
+        self._digest.update(data)
+        if self._path is None and self.size > self.spool_bytes:
+            # Too big to keep in memory, move what we have so far to a temp file
+            spool = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+            spool.write(self._file.getvalue())
+            self._file = spool
+            self._path = spool.name
+        return self._file.write(data)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def detach(self):
+        """Hand the upload over as an UploadBuffer; closing the request no longer deletes it."""
+        self._detached = True
+        digest = self._digest.hexdigest()
+        if self._path is None:
+            return UploadBuffer(data=self._file.getvalue(), size=self.size, digest=digest)
+        self._file.close()
+        return UploadBuffer(path=self._path, size=self.size, digest=digest)
+
+    def close(self):
+        self._file.close()
+        if self._path is not None and not self._detached and os.path.exists(self._path):
+            os.remove(self._path)
+
+
+def take_upload(file, max_bytes):
+    """The UploadBuffer for a request file: detached from the parser's spool, or read from any other stream once."""
+    if isinstance(file.stream, SpooledUpload):
+        return file.stream.detach()
+    return read_upload(file.stream, max_bytes)
+
+
+def read_upload(stream, max_bytes, spool_bytes=1024 * 1024):
+    """Read an upload stream once, hashing it as it arrives and rejecting it as soon as it exceeds max_bytes."""
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    spool = None
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"File exceeds the upload limit of {max_bytes} bytes")
+            digest.update(chunk)
+            if spool is None and size > spool_bytes:
+                # Too big to keep in memory, move what we have so far to a temp file
+                spool = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+                spool.writelines(chunks)
+                chunks = []
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                chunks.append(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+        raise
+
+    if spool is not None:
+        spool.close()
+        return UploadBuffer(path=spool.name, size=size, digest=digest.hexdigest())
+    return UploadBuffer(data=b"".join(chunks), size=size, digest=digest.hexdigest())
+
+
+class UploadWriter:
+    """Persist uploads to disk on a background thread, off the request path."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def persist(self, upload, dest_path):
+        """Queue an upload to be written to dest_path; the buffer must not be used afterwards."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((upload, dest_path))
+
+    def _run(self):
+        while True:
+            upload, dest_path = self._queue.get()
+            try:
+                os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+                if upload.data is not None:
+                    with open(dest_path, 'wb') as f:
+                        f.write(upload.data)
+                else:
+                    shutil.move(upload.path, dest_path)
+            except OSError as e:
+                print(f"Failed to save upload to {dest_path}: {e}")
+                upload.discard()